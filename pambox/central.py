@@ -22,12 +22,23 @@ except AttributeError:
         import mklfft  # MKL FFT optimizations from Continuum Analytics
         from numpy.fft import fft, ifft, rfft, irfft
     except ImportError:
-        # Finally, just use Numpy's and Scipy's
-        from scipy.fftpack import fft, ifft
-        from numpy.fft import rfft, irfft
+        try:
+            # SciPy >= 1.4 keeps single-precision inputs in single precision
+            from scipy.fft import fft, ifft, rfft, irfft
+        except ImportError:
+            # Finally, just use Numpy's and Scipy's
+            from scipy.fftpack import fft, ifft
+            from numpy.fft import rfft, irfft
 from scipy.optimize import leastsq
 from scipy.stats import norm
 
+from .utils import LRUCache
+
+
+# Transfer functions of the EPSM modulation filterbank, shared between
+# instances and keyed by the filterbank parameters and the signal length.
+_epsm_tf_cache = LRUCache(maxsize=32)
+
 
 class IdealObs(object):
     """Statistical ideal observer.
@@ -207,6 +218,15 @@ class EPSMModulationFilterbank(object):
         Q-factor of the modulation filters. Defaults to 1.
     low_pass_order : float
         Order of the low-pass filter. Defaults to 3.
+    dtype : str or dtype, optional
+        Floating-point type of the calculation and of the outputs. With
+        'float32', the spectra are calculated as complex64. Defaults to
+        'float64'.
+    output_time : bool, optional
+        If `True`, also outputs the time signals at the output of the
+        filterbank. Otherwise, only the envelope powers are returned, which
+        skips the inverse FFTs and the allocation of the time signals.
+        Defaults to `True`.
 
     Methods
     -------
@@ -232,23 +252,26 @@ class EPSMModulationFilterbank(object):
 
     """
 
-    def __init__(self, fs, modf, q=1., low_pass_order=3.):
+    def __init__(self, fs, modf, q=1., low_pass_order=3., dtype='float64',
+                 output_time=True):
         self.fs = fs
         self.modf = np.asarray(modf)
         self.q = q     # Q-factor of band-pass filters
         self.lp_order = low_pass_order     # order of the low-pass filter
+        self.dtype = np.dtype(dtype)
+        self.output_time = output_time
 
     def _calculate_coefficients(self, freqs):
         fcs = self.modf[1:]
         fcut = self.modf[0]
         # Initialize transfer function
         TFs = np.zeros((len(fcs) + 1, len(freqs))).astype('complex')
-        # Calculating frequency-domain transfer function for each center
-        # frequency:
-        for k in range(len(fcs)):
-            TFs[k + 1, 1:] = \
-                1. / (1. + (1j * self.q * (freqs[1:] / fcs[k] -  fcs[k] /
-                                                   freqs[1:])))  # p287 Hambley.
+        # Calculating frequency-domain transfer function for all center
+        # frequencies at once:
+        fcs = fcs[:, np.newaxis]
+        TFs[1:, 1:] = \
+            1. / (1. + (1j * self.q * (freqs[1:] / fcs - fcs /
+                                       freqs[1:])))  # p287 Hambley.
 
         # squared filter magnitude transfer functions
         Wcf = np.square(np.abs(TFs))
@@ -262,57 +285,91 @@ class EPSMModulationFilterbank(object):
         TFs[0, :] = np.sqrt(Wcf[0, :])
         return TFs, Wcf
 
-    def filter(self, signal):
+    def _transfer_functions(self, n):
+        """Returns the transfer functions for a signal of length `n`.
+
+        The transfer functions only depend on the length of the signal and
+        on the parameters of the filterbank. They are calculated once and
+        kept in a cache shared by all instances.
+
+        Parameters
+        ----------
+        n : int
+            Length of the envelope signal.
+
+        Returns
+        -------
+        TFs : ndarray
+            Complex transfer functions at the positive frequencies, of shape
+            ``(N_MODF, n // 2 + 1)``.
+        Wcf : ndarray
+            Squared magnitude of the transfer functions.
         """
+        key = (n, float(self.fs), tuple(self.modf.tolist()), float(self.q),
+               float(self.lp_order), self.dtype.str)
+        tfs = _epsm_tf_cache.get(key)
+        if tfs is None:
+            pos_freqs = np.linspace(0, self.fs / 2, n // 2 + 1)
+            TFs, Wcf = self._calculate_coefficients(pos_freqs)
+            tfs = (TFs.astype(np.result_type(self.dtype, np.complex64)),
+                   Wcf.astype(self.dtype))
+            _epsm_tf_cache[key] = tfs
+        return tfs
+
+    def filter(self, signal):
+        """Filters envelopes using the modulation filterbank.
+
+        All the envelopes of a stack are filtered at once: the FFTs, power
+        integrations, and inverse FFTs are done as array operations over
+        all the envelopes and all the modulation filters. Real FFTs are
+        used, and envelopes of even and odd lengths are both supported.
 
         Parameters
         ----------
         signal : ndarray
-            Temporal envelope of a signal
+            Temporal envelope of a signal, or stack of envelopes with shape
+            ``(..., N)``, e.g. ``(N_SIG, N_CHAN, N)``.
         Returns
         -------
-        tuple of ndarray
-            Integrated power spectrum at the output of each filter
-            Filtered time signals.
+        powers : ndarray
+            Integrated power spectrum at the output of each filter, with shape
+            ``(..., N_MODF)``.
+        filtered_envs : ndarray
+            Filtered time signals, with shape ``(..., N_MODF, N)``. Only
+            returned if `output_time` is `True`.
         """
 
-        # Make signal odd length
-        signal = signal[0:-1] if (len(signal) % 2) == 0 else signal
+        signal = np.asarray(signal, dtype=self.dtype)
 
         n = signal.shape[-1]  # length of envelope signals
-        X = fft(signal)
-        X_mag = np.abs(X)
-        X_power = np.square(X_mag) / n  # power spectrum
-        X_power_pos = X_power[0:np.floor(n / 2).astype('int') + 1]
-        # take positive frequencies only and multiply by two to get the same total
-        # energy
-        X_power_pos[1:] = X_power_pos[1:] * 2
-
-        pos_freqs = np.linspace(0, self.fs / 2, X_power_pos.shape[-1])
-        # Concatenate vector of 0:fs and -fs:1
-        freqs = np.concatenate((pos_freqs, pos_freqs[-1:0:-1]))
-
-        TFs, Wcf = self._calculate_coefficients(freqs)
+        X = rfft(signal, axis=-1)
+        X_power_pos = np.square(np.abs(X)) / n  # power spectrum
+        # take positive frequencies only and multiply by two to get the same
+        # total energy. The Nyquist frequency of even-length signals has no
+        # negative counterpart.
+        if n % 2 == 0:
+            X_power_pos[..., 1:-1] *= 2
+        else:
+            X_power_pos[..., 1:] *= 2
 
-        # initialize output product:
-        vout = np.zeros((len(self.modf), len(pos_freqs)))
-        powers = np.zeros(len(self.modf))
+        TFs, Wcf = self._transfer_functions(n)
 
         # ------------ DC-power, --------------------------
         # here divide by two such that a fully modulated tone has an AC-power of 1.
-        dc_power = X_power_pos[0] / n / 2
+        dc_power = X_power_pos[..., :1] / n / 2
         # ------------------------------------------------
-        X_filt = np.zeros((Wcf.shape[0], X.shape[-1]), dtype='complex128')
-        filtered_envs = np.zeros_like(X_filt, dtype='float')
-
-        for k, (w, TF) in enumerate(zip(Wcf, TFs)):
-            vout[k] = X_power_pos * w[:np.floor(n / 2).astype('int') + 1]
-            # Integration estimated as a sum from f > 0
-            # integrate envelope power in the passband of the filter. Index goes
-            # from 2:end since integration is for f>0
-            powers[k] = np.sum(vout[k, 1:]) / n / dc_power
-            # Filtering and inverse Fourier transform to get time signal.
-            X_filt[k] = X * TF
-            filtered_envs[k] = np.real(ifft(X_filt[k]))
+        # Integration estimated as a sum from f > 0
+        # integrate envelope power in the passband of the filter. Index goes
+        # from 2:end since integration is for f>0
+        powers = np.dot(X_power_pos[..., 1:], Wcf[:, 1:].T) / n / dc_power
         powers[np.isnan(powers)] = 0
-        return powers, filtered_envs
+        if not self.output_time:
+            return powers
+
+        # Filtering and inverse Fourier transform to get time signal. The
+        # negative frequencies of the transfer functions mirror the positive
+        # ones, rather than being their complex conjugate. Taking the real
+        # part of the full inverse FFT is therefore the same as filtering
+        # with the real part of the transfer functions.
+        filtered_envs = irfft(X[..., np.newaxis, :] * TFs.real, n, axis=-1)
+        return powers, filtered_envs.astype(self.dtype, copy=False)
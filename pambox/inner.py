@@ -9,7 +9,7 @@ from numpy import exp, sin, cos, sqrt, abs, ones, pi
 import scipy as sp
 import scipy.signal as ss
 
-from .utils import next_pow_2, hilbert
+from .utils import next_fast_len, LRUCache
 
 
 try:
@@ -20,9 +20,13 @@ except AttributeError:
         import mklfft  # MKL FFT optimizations from Continuum Analytics
         from numpy.fft import fft, ifft, rfft, irfft
     except ImportError:
-        # Finally, just use Numpy's and Scipy's
-        from scipy.fftpack import fft, ifft
-        from numpy.fft import rfft, irfft
+        try:
+            # SciPy >= 1.4 keeps single-precision inputs in single precision
+            from scipy.fft import fft, ifft, rfft, irfft
+        except ImportError:
+            # Finally, just use Numpy's and Scipy's
+            from scipy.fftpack import fft, ifft
+            from numpy.fft import rfft, irfft
 
 
 CENTER_F = np.asarray([63, 80, 100, 125, 160, 200, 250, 315, 400, 500,
@@ -30,6 +34,14 @@ CENTER_F = np.asarray([63, 80, 100, 125, 160, 200, 250, 315, 400, 500,
                        5000, 6300, 8000])
 FS = np.asarray([22050.])
 
+# Second-order sections of the gammatone filters, shared between instances
+# and keyed by the parameters of the filterbank.
+_gammatone_sos_cache = LRUCache(maxsize=32)
+
+# Boundaries of the bands of the rectangular filterbanks, in FFT bins, keyed
+# by the signal length and the parameters of the filterbank.
+_rect_band_cache = LRUCache(maxsize=32)
+
 
 def erb_bandwidth(fc):
     """Bandwith or an ERB.
@@ -64,14 +76,106 @@ def lowpass_env_filtering(x, cutoff=150., n=1, fs=22050):
     Returns
     -------
     ndarray
-        Low-pass filtered signal.
+        Low-pass filtered signal. Single-precision inputs are filtered in
+        single precision.
 
     """
 
+    x = np.asarray(x)
     b, a = sp.signal.butter(N=n, Wn=cutoff * 2. / fs, btype='lowpass')
+    if x.dtype == np.float32:
+        # Keep single-precision inputs in single precision.
+        b, a = b.astype(x.dtype), a.astype(x.dtype)
     return sp.signal.lfilter(b, a, x)
 
 
+def lowpass_env_decimation(x, factor, cutoff=150., n=1, fs=22050):
+    r"""Low-pass filters and downsamples a signal in a single step.
+
+    The result is the same as low-pass filtering the signal with
+    :py:func:`lowpass_env_filtering` and keeping every `factor`-th sample,
+    but the filter is only evaluated at the output sampling rate.
+
+    Parameters
+    ----------
+    x : ndarray
+        Signal to filter. The filtering is done along the last axis.
+    factor : int
+        Downsampling factor.
+    cutoff : float, optional
+        Cut-off frequency of the low-pass filter, in Hz. The default is 150 Hz.
+    n : int, optional
+        Order of the low-pass filter. The default is 1.
+    fs : float, optional
+        Sampling frequency of the signal to filter. The default is 22050 Hz.
+
+    Returns
+    -------
+    ndarray
+        Low-pass filtered and downsampled signal, with ``ceil(N / factor)``
+        samples along the last axis. Single-precision inputs give
+        single-precision outputs.
+
+    Notes
+    -----
+    The Butterworth filter is split into a sum of first-order sections
+    (partial fraction expansion). The output of a section with pole `p` and
+    residue `r`, at every `factor`-th sample, is:
+
+    .. math::
+
+        y[mD] = p^D y[(m-1)D] + \sum_{j=0}^{D-1} r p^j x[mD - j],
+
+    where `D` is the downsampling factor. The sum is a product of the
+    consecutive blocks of `D` samples of the input with fixed weights, and
+    the recursion runs at the output rate.
+
+    """
+    x = np.asarray(x)
+    factor = int(factor)
+    b, a = sp.signal.butter(N=n, Wn=cutoff * 2. / fs, btype='lowpass')
+    # Real poles, like the one of the default first-order filter, are kept
+    # real to avoid complex arithmetic.
+    r, p, k = [np.real_if_close(c) for c in sp.signal.residuez(b, a)]
+    if x.dtype == np.float32:
+        # Keep single-precision inputs in single precision, also in the
+        # products of the blocks with the weights.
+        r, p, k = [c.astype(np.complex64 if np.iscomplexobj(c)
+                            else np.float32) for c in (r, p, k)]
+    if len(k) > factor:
+        raise ValueError("The downsampling factor is too small for the "
+                         "low-pass filter.")
+
+    n_out = -(-x.shape[-1] // factor)
+    # Blocks of `factor` consecutive samples, where the last sample of a
+    # block is an output sample. The first output sample, which has no
+    # complete block, is treated separately. This is a view of the input.
+    blocks = x[..., 1:1 + (n_out - 1) * factor].reshape(
+        x.shape[:-1] + (n_out - 1, factor))
+    # Lags of the block samples relative to the output sample.
+    lags = np.arange(factor - 1, -1, -1)
+
+    y = np.zeros(x.shape[:-1] + (n_out,), dtype=np.result_type(r, p, k, x))
+    # Direct (FIR) term of the filter.
+    for lag, k_lag in enumerate(k):
+        y[..., lag > 0:] += k_lag * x[..., (factor - lag) % factor::factor][
+            ..., :n_out - (lag > 0)]
+    # First-order sections, with the recursion at the output rate.
+    for r_pole, pole in zip(r, p):
+        # The weights and coefficients have the precision of the poles, so
+        # that single-precision blocks are not upcast.
+        coef_dtype = np.result_type(r_pole, pole)
+        sections = np.empty_like(y)
+        sections[..., 0] = r_pole * x[..., 0]
+        sections[..., 1:] = np.dot(
+            blocks, (r_pole * pole ** lags).astype(coef_dtype))
+        y += ss.lfilter(np.ones(1, dtype=coef_dtype),
+                        np.array([1., -pole ** factor], dtype=coef_dtype),
+                        sections, axis=-1)
+    dtype = np.float32 if x.dtype == np.float32 else np.float64
+    return np.real(y).astype(dtype)
+
+
 class GammatoneFilterbank(object):
     """Gammatone Filterbank
 
@@ -89,6 +193,25 @@ class GammatoneFilterbank(object):
         Q-value of the ERB. The default value is 9.26449.
     min_bw : float
         Minimum bandwidth of an ERB.
+    stateful : bool, optional
+        If `True`, the state of the filters is kept between calls to
+        :py:func:`filter`, such that a long signal can be filtered in
+        consecutive chunks. The concatenated outputs are the same as the
+        output of a single call with the full signal. Use :py:func:`reset` to
+        start filtering a new signal. The default is `False`.
+    dtype : str or dtype, optional
+        Floating-point type of the filter coefficients and of the outputs.
+        Use 'float32' to halve the memory used by the outputs. The default is
+        'float64'.
+
+    Examples
+    --------
+
+    Filtering a long signal in chunks of one second:
+
+    >>> g = GammatoneFilterbank(22050, [250, 1000, 4000], stateful=True)
+    >>> chunks = [g.filter(chunk) for chunk in np.split(x, n_seconds)]
+    >>> y = np.concatenate(chunks, axis=-1)
 
     References
     ----------
@@ -96,7 +219,8 @@ class GammatoneFilterbank(object):
     """
 
 
-    def __init__(self, fs, cf, b=1.019, order=1, q=9.26449, min_bw=24.7):
+    def __init__(self, fs, cf, b=1.019, order=1, q=9.26449, min_bw=24.7,
+                 stateful=False, dtype='float64'):
 
         self.fs = fs
         try:
@@ -108,7 +232,21 @@ class GammatoneFilterbank(object):
         self.erb_order = order
         self.q = q
         self.min_bw = min_bw
+        self.stateful = stateful
+        self.dtype = np.dtype(dtype)
+        self._zi = None
 
+    def reset(self):
+        """Resets the state of the filters to zero.
+
+        Only useful if the filterbank is `stateful`.
+
+        Returns
+        -------
+        self
+        """
+        self._zi = None
+        return self
 
     def _calculate_coefficients(self):
         cf = self.cf
@@ -156,42 +294,100 @@ class GammatoneFilterbank(object):
         return a0 * allfilts, a11, a12, a13, a14, a2 * allfilts, \
             b0 * allfilts, b1, b2, gain
 
-    def filter(self, x):
+    def _calculate_sos(self):
+        """Stacks the coefficients of all channels as second-order sections.
+
+        The sections only depend on the parameters of the filterbank. They
+        are calculated once per set of parameters and kept in a cache shared
+        by all instances. Because the cache is keyed by the current values of
+        the attributes, changing them after construction is safe.
+
+        Returns
+        -------
+        ndarray
+            Second-order sections of shape ``(M, 4, 6)``, where ``M`` is the
+            number of channels. Each channel is a cascade of four biquads,
+            in the format expected by :func:`scipy.signal.sosfilt`. The gain
+            normalization is applied to the first section. The array is
+            shared and must not be modified.
+        """
+        key = (float(self.fs), tuple(np.ravel(self.cf).tolist()),
+               float(self.b), self.erb_order, float(self.q),
+               float(self.min_bw))
+        sos = _gammatone_sos_cache.get(key)
+        if sos is not None:
+            return sos
+
+        a0, a11, a12, a13, a14, a2, b0, b1, b2, gain = \
+            self._calculate_coefficients()
+        sos = np.empty((len(gain), 4, 6))
+        sos[:, :, 0] = a0[:, np.newaxis]
+        sos[:, :, 1] = np.column_stack((a11, a12, a13, a14))
+        sos[:, :, 2] = a2[:, np.newaxis]
+        sos[:, :, 3] = b0[:, np.newaxis]
+        sos[:, :, 4] = b1[:, np.newaxis]
+        sos[:, :, 5] = b2[:, np.newaxis]
+        sos[:, 0, :3] /= gain[:, np.newaxis]
+        _gammatone_sos_cache[key] = sos
+        return sos
+
+    def filter(self, x, channels=None):
         """Filters a signal along its last dimension.
 
         Parameters
         ----------
         x : ndarray
-            Signal to filter.
+            Signal to filter. It can also be a stack of signals, of shape
+            ``(..., N)``, in which case all the signals are filtered at once.
+        channels : slice or array_like, optional
+            Indexes of the channels to filter. Filtering the channels in
+            blocks limits the memory used by the outputs. The default is to
+            filter all channels.
 
         Returns
         -------
         ndarray
             Filtered signals with shape ``(M, N)``, where ``M`` is the number of
-            channels, and ``N`` is the input signal's nubmer of samples.
+            channels, and ``N`` is the input signal's nubmer of samples. For a
+            stack of signals, the shape is ``(..., M, N)``.
+
+        Notes
+        -----
+        The four cascaded biquads of a channel are applied in a single call
+        to :func:`scipy.signal.sosfilt`, instead of four chained calls to
+        :func:`scipy.signal.lfilter`. The results are the same.
         """
-
-        a0, a11, a12, a13, a14, a2, b0, b1, b2, gain = self._calculate_coefficients()
-
-        output = np.zeros((gain.shape[0], x.shape[-1]))
-        for chan in range(gain.shape[0]):
-            y1 = ss.lfilter([a0[chan] / gain[chan], a11[chan] / gain[chan],
-                             a2[chan] / gain[chan]],
-                            [b0[chan], b1[chan], b2[chan]], x)
-            y2 = ss.lfilter([a0[chan], a12[chan], a2[chan]],
-                            [b0[chan], b1[chan], b2[chan]], y1)
-            y3 = ss.lfilter([a0[chan], a13[chan], a2[chan]],
-                            [b0[chan], b1[chan], b2[chan]], y2)
-            y4 = ss.lfilter([a0[chan], a14[chan], a2[chan]],
-                            [b0[chan], b1[chan], b2[chan]], y3)
-            output[chan, :] = y4
-
+        x = np.asarray(x, dtype=self.dtype)
+        sos = self._calculate_sos().astype(self.dtype)
+        chan_idx = np.arange(sos.shape[0])
+        if channels is not None:
+            chan_idx = np.atleast_1d(chan_idx[channels])
+
+        output = np.empty(x.shape[:-1] + (len(chan_idx), x.shape[-1]),
+                          dtype=self.dtype)
+        if not self.stateful:
+            for i_out, chan in enumerate(chan_idx):
+                output[..., i_out, :] = ss.sosfilt(sos[chan], x, axis=-1)
+            return output
+
+        # The state of each biquad, for each channel and each input signal.
+        zi_shape = sos.shape[:2] + x.shape[:-1] + (2,)
+        if self._zi is None:
+            self._zi = np.zeros(zi_shape, dtype=self.dtype)
+        elif self._zi.shape != zi_shape:
+            raise ValueError("The shape of the input, or the number of "
+                             "channels, changed since the last call. Call "
+                             "`reset()` before filtering a new signal.")
+        for i_out, chan in enumerate(chan_idx):
+            output[..., i_out, :], self._zi[chan] = ss.sosfilt(
+                sos[chan], x, axis=-1, zi=self._zi[chan])
         return output
 
 
 class RectangularFilterbank(object):
 
-    def __init__(self, fs, center_f, width=3, output_time=False):
+    def __init__(self, fs, center_f, width=3, output_time=False,
+                 time_bands=None):
         """Rectangular filterbank with Nth-octave wide filters.
 
         Parameters
@@ -210,6 +406,9 @@ class RectangularFilterbank(object):
             is to output the RMS value of each band only. Doing the inverse FFT
             is very costly; setting the argument to `False` prevents from doing
             that computation.
+        time_bands : array_like, optional
+            Indexes of the bands for which the time outputs are calculated,
+            if `output_time` is `True`. The default is to output all bands.
 
         Returns
         -------
@@ -217,48 +416,119 @@ class RectangularFilterbank(object):
              RMS power at the output of each filter.
         out_time : ndarray
              Time signals at the output of the filterbank. The shape is (`len(
-             center_f) x len(x)`).
+             center_f) x len(x)`), or (`len(time_bands) x len(x)`).
 
         """
         self.fs = fs
         self.center_f = center_f
         self.width = width
         self.output_time = output_time
+        self.time_bands = time_bands
 
-    def filter(self, x):
-        # Use numpy's FFT because SciPy's version of rfft (2 real results per
-        # frequency bin) behaves differently from numpy's (1 complex result per
-        # frequency bin)
-        center_f = np.asarray(self.center_f, dtype='float')
+    def _band_edges(self, n):
+        """Calculates the FFT bins at the boundaries of the bands.
 
-        n = len(x)
-        # TODO Use powers of 2 to calculate the power spectrum, and also, possibly
-        # use RFFT instead of the complete fft.
-        X = rfft(x)
-        X_pow = np.abs(X) ** 2 / n  # Power spectrum
-        X_pow[1:] = X_pow[1:] * 2.
+        The edges only depend on the signal length and on the parameters of
+        the filterbank, and are cached.
+
+        Parameters
+        ----------
+        n : int
+            Length of the signals to filter.
+
+        Returns
+        -------
+        ndarray
+            Index of the first bin of each band, followed by the index after
+            the last bin of the last band. The bands are contiguous. Bands
+            above the Nyquist frequency are left out.
+
+        """
+        key = (n, float(self.fs), tuple(np.ravel(self.center_f).tolist()),
+               float(self.width))
+        bound_idx = _rect_band_cache.get(key)
+        if bound_idx is not None:
+            return bound_idx
+
+        center_f = np.asarray(self.center_f, dtype='float')
         bound_f = np.zeros(len(center_f) + 1)
         bound_f[0] = center_f[0] * 2. ** (- 1. / (2. * self.width))
         bound_f[1:] = center_f * 2. ** (1. / (2. * self.width))
         bound_f = bound_f[bound_f < self.fs / 2]
         # Convert from frequencies to vector indexes. Factor of two is because
         # we consider positive frequencies only.
-        bound_idx = np.floor(bound_f / (self.fs / 2.) * len(X_pow)).astype('int')
-        # Initialize arrays
-        out_rms = np.zeros(len(center_f))
-        out_time = np.zeros((len(center_f), x.shape[-1]), dtype='complex')
-        for idx, (l, f) in enumerate(zip(bound_idx[0:], bound_idx[1:])):
-            out_time[idx, l:f] = X[l:f]
-            out_rms[idx] = np.sqrt(np.sum(X_pow[l:f]) / n)
-        if self.output_time:
-            out_time = np.real(irfft(out_time, n=n, axis=-1))
-            return out_rms, out_time
+        bound_idx = np.floor(bound_f / (self.fs / 2.) * (n // 2 + 1)) \
+            .astype('int')
+        _rect_band_cache[key] = bound_idx
+        return bound_idx
+
+    def filter(self, x):
+        """Filters signals along their last dimension.
+
+        Parameters
+        ----------
+        x : array_like
+            Signal to filter. It can also be a stack of signals, of shape
+            ``(..., N)``, in which case all the signals are filtered at once.
+
+        Returns
+        -------
+        out_rms : ndarray
+            RMS value at the output of each band, of shape ``(...,
+            N_BANDS)``.
+        out_time : ndarray
+            Time signals at the output of the filterbank, of shape ``(...,
+            N_BANDS, N)``, only if `output_time` is `True`. Only the bands
+            in `time_bands` are output, if it is set.
+
+        """
+        x = np.asarray(x)
+        n = x.shape[-1]
+        n_bands = len(self.center_f)
+        X = rfft(x, axis=-1)
+        X_pow = np.abs(X) ** 2 / n  # Power spectrum
+        X_pow[..., 1:] *= 2.
+        bound_idx = self._band_edges(n)
+        # All the bands can be above the Nyquist frequency, without edges.
+        n_valid = max(len(bound_idx) - 1, 0)
+
+        # The bands are contiguous, so the power of all the bands is a
+        # single sum over consecutive segments of the power spectrum. The
+        # empty bands at the end, which start at the end of the summed
+        # spectrum, are left at zero...
+        out_rms = np.zeros(x.shape[:-1] + (n_bands,))
+        if n_valid > 0:
+            n_summed = np.count_nonzero(bound_idx[:n_valid] < bound_idx[-1])
         else:
+            n_summed = 0
+        if n_summed > 0:
+            starts = bound_idx[:n_summed]
+            band_pow = np.add.reduceat(X_pow[..., :bound_idx[-1]], starts,
+                                       axis=-1)
+            # ... except that `reduceat` does not return zero for empty
+            # bands.
+            band_pow[..., starts == bound_idx[1:n_summed + 1]] = 0
+            out_rms[..., :n_summed] = np.sqrt(band_pow / n)
+
+        if not self.output_time:
             return out_rms
 
+        if self.time_bands is None:
+            time_bands = np.arange(n_bands)
+        else:
+            time_bands = np.atleast_1d(self.time_bands)
+        out_time = np.zeros(x.shape[:-1] + (len(time_bands), X.shape[-1]),
+                            dtype=X.dtype)
+        for i_out, band in enumerate(time_bands):
+            if band < n_valid:
+                l, f = bound_idx[band], bound_idx[band + 1]
+                out_time[..., i_out, l:f] = X[..., l:f]
+        out_time = irfft(out_time, n=n, axis=-1)
+        return out_rms, out_time
+
 
-def hilbert_envelope(signal, axis=None):
-    """Calculates the Hilbert envelope of a signal.
+def hilbert_envelope(signal, axis=None, dtype='float64'):
+    r"""Calculates the Hilbert envelope of a signal.
 
     Parameters
     ----------
@@ -267,16 +537,35 @@ def hilbert_envelope(signal, axis=None):
         envelope. The calculation is done on the last axis (i.e. ``axis=-1``).
     axis :
          (Default value = None)
+    dtype : str or dtype, optional
+        Floating-point type of the calculation and of the envelope. With
+        'float32', the spectra are calculated as complex64. The default is
+        'float64'.
 
     Returns
     -------
     ndarray
 
+    Notes
+    -----
+    The envelope is the magnitude of the analytic signal, :math:`\sqrt{x^2 +
+    \mathcal{H}\{x\}^2}`. The Hilbert transform :math:`\mathcal{H}\{x\}` is
+    calculated with a pair of real FFTs, zero-padded to the next 5-smooth
+    length (see :py:func:`~pambox.utils.next_fast_len`) to avoid circular
+    wrapping at the edges of the signal.
+
     """
-    signal = np.asarray(signal)
+    signal = np.asarray(signal, dtype=dtype)
     N_orig = signal.shape[-1]
-    # Next power of 2.
-    N = next_pow_2(N_orig)
-    y_h = hilbert(signal, N)
-    # Return signal with same dimensions as original
-    return np.abs(y_h[..., :N_orig])
+    N = next_fast_len(N_orig)
+    Xf = rfft(signal, N, axis=-1)
+    # The Hilbert transform is a -90 degree phase shift of the positive
+    # frequencies. The DC and the Nyquist components are removed.
+    Xf *= -1j
+    Xf[..., 0] = 0
+    if N % 2 == 0:
+        Xf[..., -1] = 0
+    env = irfft(Xf, N, axis=-1)[..., :N_orig]
+    del Xf
+    env = np.hypot(signal, env, out=env)
+    return env.astype(dtype, copy=False)
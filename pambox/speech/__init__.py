@@ -8,7 +8,7 @@ from __future__ import absolute_import
 from .sepsm import Sepsm
 from .mrsepsm import MrSepsm
 from .sii import Sii
-from .material import Material
+from .material import Material, MappedMaterial
 from .experiment import Experiment
 
 __all__ = [
@@ -16,5 +16,6 @@ __all__ = [
     'MrSepsm',
     'Sii',
     'Material',
+    'MappedMaterial',
     'Experiment'
 ]
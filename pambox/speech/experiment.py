@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function, absolute_import
+import csv
 from datetime import datetime
 from itertools import product
 import logging
 import os
 import os.path
 from functools import partial
+import multiprocessing
 
-from IPython import parallel as ipyparallel
+try:
+    from IPython import parallel as ipyparallel
+except ImportError:
+    ipyparallel = None
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -20,6 +25,135 @@ import six
 log = logging.getLogger(__name__)
 
 
+# Experiment used by the parallel workers of `Experiment.run`. It is sent
+# once to each worker, which then only receives the numbers of the sentences
+# to process.
+_worker_experiment = None
+
+
+def _init_worker(experiment):
+    global _worker_experiment
+    _worker_experiment = experiment
+
+
+def _worker_run_sentence(task):
+    i_target = task[0]
+    return i_target, _worker_experiment._run_sentence(*task)
+
+
+
+class _ResultStream(object):
+    """Appends the results of an experiment to a CSV file as they come.
+
+    Next to the CSV file, a manifest (with a `.done` extension) lists the
+    keys of the conditions whose results are written, with the size of the
+    CSV file after their rows. When resuming, the conditions of the manifest
+    are skipped, and rows written after the last condition of the manifest,
+    e.g. by an interrupted run, are discarded.
+
+    Parameters
+    ----------
+    path : str
+        Path to the CSV file.
+    fieldnames : list of str
+        Columns of the CSV file. A row may leave some of them empty, but may
+        not have other columns.
+    exclude : list of str, optional
+        Columns of the results that are not written.
+    resume : bool, optional
+        Continue an existing file instead of overwriting it.
+
+    Raises
+    ------
+    ValueError
+        If the columns of the file to resume differ from `fieldnames`.
+    """
+
+    def __init__(self, path, fieldnames, exclude=(), resume=False):
+        self.path = path
+        self.manifest_path = path + '.done'
+        self.fieldnames = list(fieldnames)
+        self.exclude = set(exclude)
+        self.done = set()
+        self.previous = None
+
+        offset = None
+        if resume and os.path.exists(self.manifest_path) \
+                and os.path.exists(path):
+            manifest_size = 0
+            with open(self.manifest_path, 'rb') as f:
+                for line in f:
+                    # Stop at a line that was not written completely.
+                    if not line.endswith(b'\n'):
+                        break
+                    manifest_size += len(line)
+                    offset, key = line.decode('utf-8').rstrip('\n').split(
+                        '\t', 1)
+                    self.done.add(key)
+
+        header = None
+        if self.done and os.path.getsize(path) < int(offset):
+            log.warning("The file %s is shorter than in its manifest, the "
+                        "experiment is run again.", path)
+            self.done = set()
+        if self.done:
+            with open(path, 'r+') as f:
+                f.truncate(int(offset))
+            with self._open(path, 'r') as f:
+                header = next(csv.reader(f), None)
+            if header is None:
+                # The CSV file is empty, there is nothing to resume.
+                self.done = set()
+
+        if self.done:
+            if header != self.fieldnames:
+                raise ValueError("The columns of the file to resume, {}, "
+                                 "differ from the columns of the experiment, "
+                                 "{}.".format(header, self.fieldnames))
+            self.previous = pd.read_csv(path)
+            # Drop the end of a manifest line that was not written
+            # completely, so that the next key starts on its own line.
+            with open(self.manifest_path, 'r+') as f:
+                f.truncate(manifest_size)
+            self._file = self._open(path, 'a')
+            self._manifest = open(self.manifest_path, 'a')
+            self._writer = csv.DictWriter(self._file, self.fieldnames)
+        else:
+            self._file = self._open(path, 'w')
+            self._manifest = open(self.manifest_path, 'w')
+            self._writer = csv.DictWriter(self._file, self.fieldnames)
+            self._writer.writeheader()
+
+    @staticmethod
+    def _open(path, mode):
+        if six.PY2:
+            return open(path, mode + 'b')
+        return open(path, mode, newline='')
+
+    def write(self, key, records):
+        """Writes the results of a condition and adds it to the manifest.
+
+        Parameters
+        ----------
+        key : str
+            Key of the condition, as given by
+            :py:func:`Experiment._condition_key`.
+        records : list of dict
+            Rows of results of the condition.
+        """
+        self._writer.writerows(
+            dict((k, v) for k, v in six.iteritems(record)
+                 if k not in self.exclude) for record in records)
+        self._file.flush()
+        self._manifest.write('{}\t{}\n'.format(self._file.tell(), key))
+        self._manifest.flush()
+        self.done.add(key)
+
+    def close(self):
+        self._file.close()
+        self._manifest.close()
+
+
 class Experiment(object):
     """
     Performs a speech intelligibility experiment.
@@ -156,9 +290,8 @@ class Experiment(object):
     def next_masker(self, target, params):
         return self.material.ssn(target)
 
-    def append_results(
+    def _result_records(
             self,
-            df,
             res,
             model,
             snr,
@@ -167,12 +300,10 @@ class Experiment(object):
             **kwargs
     ):
         """
-        Appends results to a DataFrame
+        Lists the rows of results for a model prediction.
 
         Parameters
         ----------
-        df : dataframe
-            DataFrame where the new results will be appended.
         res : dict
             Output dictionary from an intelligibility model.
         model: object
@@ -185,16 +316,15 @@ class Experiment(object):
             Number of the target sentence
         params : object
             Parameters that were passed to the distortion process.
+        kwargs :
+            Additional columns, e.g. the SRT of an adaptive experiment.
 
         Returns
         -------
-        df : dataframe
-            DataFrame with new entry appended.
+        records : list of dict
+            One row per output of the model, with the column names as keys.
         """
-        try:
-            model_name = model.name
-        except AttributeError:
-            model_name = model.__class__.__name__
+        model_name = self._model_name(model)
         try:
             material_name = self.material.name
         except AttributeError:
@@ -218,13 +348,110 @@ class Experiment(object):
             else:
                 pass
             d[self._key_dist_params] = params
+        d.update(kwargs)
 
+        records = []
         for name, value in six.iteritems(res['p']):
-            d[self._key_output] = name
-            d[self._key_value] = value
-            df = df.append(d, ignore_index=True)
+            record = d.copy()
+            record[self._key_output] = name
+            record[self._key_value] = value
+            records.append(record)
+        return records
 
-        return df
+    @staticmethod
+    def _model_name(model):
+        try:
+            return model.name
+        except AttributeError:
+            return model.__class__.__name__
+
+    def _result_columns(self):
+        """Lists the columns of the results of the experiment.
+
+        Returns
+        -------
+        list of str
+            Columns of the rows given by :py:func:`_result_records`, for all
+            the distortion parameters of the experiment.
+        """
+        columns = [
+            self._key_snr,
+            self._key_models,
+            self._key_sent,
+            self._key_full_pred,
+            self._key_material
+        ]
+        for params in self.dist_params:
+            keys = params if isinstance(params, dict) \
+                else [self._key_dist_params]
+            columns.extend(k for k in keys if k not in columns)
+        return columns + [self._key_output, self._key_value]
+
+    def _condition_key(self, i_target, params, snr, i_model):
+        """Key identifying a condition in the manifest of a streamed run.
+
+        Parameters
+        ----------
+        i_target : int
+            Number of the target sentence.
+        params : object
+            Parameters of the distortion.
+        snr : float
+            SNR of the condition.
+        i_model : int
+            Index of the model in `self.models`.
+
+        Returns
+        -------
+        str
+        """
+        return '{}\t{!r}\t{}:{}\t{!r}'.format(
+            i_target, snr, i_model, self._model_name(self.models[i_model]),
+            params)
+
+    def append_results(
+            self,
+            df,
+            res,
+            model,
+            snr,
+            i_target,
+            params,
+            **kwargs
+    ):
+        """
+        Appends results to a DataFrame
+
+        The experiments collect the rows from :py:func:`_result_records` and
+        create a single DataFrame at the end of the run, which avoids copying
+        the DataFrame for every condition. This function is kept for
+        appending a few results to an existing DataFrame.
+
+        Parameters
+        ----------
+        df : dataframe
+            DataFrame where the new results will be appended.
+        res : dict
+            Output dictionary from an intelligibility model.
+        model: object
+            Intelligibility model. Will use it's `name` attribute,
+            if available, to add the source model to the DataFrame. Otherwise,
+            the `__class__.__name__` attribute will be used.
+        snr : float
+            SNR at which the simulation was performed.
+        i_target : int
+            Number of the target sentence
+        params : object
+            Parameters that were passed to the distortion process.
+
+        Returns
+        -------
+        df : dataframe
+            DataFrame with new entry appended.
+        """
+        records = self._result_records(res, model, snr, i_target, params,
+                                       **kwargs)
+        return pd.concat([df, pd.DataFrame(records)], ignore_index=True)
 
     def _model_prediction(self, model, target, mix, masker):
         """Call the `predict` method of an intelligibility model.
@@ -249,39 +476,21 @@ class Experiment(object):
         """
         return model.predict(target, mix, masker)
 
-    def _predict(self, ii_and_target, snr, model, params):
-        i_target, target = ii_and_target
-        masker = self.next_masker(target, params)
-
-        target, mix, masker = self.preprocessing(
-            target,
-            masker,
-            snr,
-            params
-        )
-        res = self._model_prediction(model, target, mix, masker)
-
-        # Initialize the dataframe in which the results are saved.
-        df = pd.DataFrame()
-        df = self.append_results(
-            df,
-            res,
-            model,
-            snr,
-            i_target,
-            params
-        )
-        return df
-
-    def _parallel_run(self, n=None, seed=0, profile=None):
+    def _parallel_run(self, n=None, seed=0, profile=None, stream=None):
         """ Run the experiment using IPython.parallel
 
+        The experiment is sent once to each engine, and the sentences are
+        distributed to the engines. Each engine loads its sentences from disk
+        and runs all the conditions of a sentence.
+
         Parameters
         ----------
         n : int
             Number of sentences to process.
         seed : int
             Seed for the random number generator. Default is 0.
+        stream : _ResultStream, optional
+            Where the results are written as they come.
 
         Returns
         -------
@@ -289,6 +498,10 @@ class Experiment(object):
             Pandas dataframe with the experimental results.
 
         """
+        if ipyparallel is None:
+            raise ImportError("IPython.parallel is required to run the "
+                              "experiment with `parallel=True`. Use "
+                              "`parallel='processes'` instead.")
         if profile:
             rc = ipyparallel.Client(profile=profile)
         else:
@@ -298,85 +511,301 @@ class Experiment(object):
         with all_engines.sync_imports():
             import os
         all_engines.apply(os.chdir, os.getcwd())
+        all_engines.block = True
+        all_engines.apply(_init_worker, self)
 
         lview = rc.load_balanced_view()
         lview.block = True
-        lview.apply(np.random.seed, seed)
 
-        try:
-            iter(self.models)
-        except TypeError:
-            self.models = [self.models]
+        i_targets = self._pending_targets(n, stream)
+        tasks = [(i_target, seed) for i_target in i_targets]
+        lview_res = lview.map(_worker_run_sentence, tasks)
+        return self._collect_results(lview_res, stream=stream)
 
-        # Initialize the dataframe in which the results are saved.
-        df = pd.DataFrame()
+    def _n_targets(self, n):
+        """Number of sentences processed by the experiment.
 
-        targets = self.material.load_files(n)
-        conditions = product(
-            enumerate(targets),
-            self.snrs,
-            self.models,
-            self.dist_params
-        )
-        lview_res = all_engines.map(self._predict, *zip(*conditions))
+        Parameters
+        ----------
+        n : int
+            Number of sentences requested. All the sentences of the material
+            are used if it is `None`.
 
-        for each in lview_res:
-            df = df.append(each, ignore_index=True)
+        Returns
+        -------
+        int
+        """
+        n_files = len(self.material.files)
+        if not n:
+            return n_files
+        return min(n, n_files)
 
-        return df
+    def _sentence_conditions(self):
+        """Lists the conditions run for each sentence.
 
-    def _single_run(self, n, seed):
-        """ Run the experiment locally using a for-loop.
+        Returns
+        -------
+        list
+            List of (params, snr, i_model) tuples, in the order in which the
+            results are stored.
+        """
+        return list(product(
+            self.dist_params,
+            self.snrs,
+            range(len(self.models))
+        ))
+
+    def _pending_targets(self, n, stream=None):
+        """Lists the sentences with conditions left to run.
 
         Parameters
         ----------
         n : int
-            Number of sentences to process.
+            Number of sentences requested.
+        stream : _ResultStream, optional
+            Stream of a resumed run. The sentences whose conditions are all
+            in its manifest are skipped.
+
+        Returns
+        -------
+        list of int
+            Numbers of the sentences to process.
+        """
+        i_targets = list(range(self._n_targets(n)))
+        if stream is None or not stream.done:
+            return i_targets
+        conditions = self._sentence_conditions()
+        return [i_target for i_target in i_targets
+                if any(self._condition_key(i_target, params, snr, i_model)
+                       not in stream.done
+                       for params, snr, i_model in conditions)]
+
+    def _run_sentence(self, i_target, seed):
+        """Runs all the conditions of a sentence.
+
+        The sentence is loaded from the material. The conditions are
+        numbered like in :py:func:`_single_run`, so that the results are the
+        same.
+
+        Parameters
+        ----------
+        i_target : int
+            Number of the sentence.
         seed : int
-            Seed for the random number generator. Default is 0.
+            Seed of the experiment.
 
         Returns
         -------
-            Pandas dataframe with the experimental results.
+        list
+            Predictions of the model for each condition, in the order of
+            :py:func:`_sentence_conditions`.
         """
+        target = self.material.load_file(self.material.files[i_target])
+        conditions = self._sentence_conditions()
+        return [self._run_condition(i_target * len(conditions) + jj,
+                                    i_target, target, params, snr, i_model,
+                                    seed)
+                for jj, (params, snr, i_model) in enumerate(conditions)]
 
-        np.random.seed(seed)
+    def _collect_results(self, sentence_results, stream=None):
+        """Collects the results of parallel runs in a DataFrame.
+
+        Parameters
+        ----------
+        sentence_results : iterable
+            Pairs of the number of a sentence and of the list of its
+            predictions as output by :py:func:`_run_sentence`. The sentences
+            can come in any order, e.g. as they are completed.
+        stream : _ResultStream, optional
+            Where the results are written as they come. The conditions that
+            are already in its manifest are skipped.
+
+        Returns
+        -------
+        df : pd.Dataframe
+            Pandas dataframe with the experimental results, ordered by
+            sentence like the results of :py:func:`_single_run`.
+        """
+        conditions = self._sentence_conditions()
+        sentence_records = {}
+        for i_target, results in sentence_results:
+            records = sentence_records.setdefault(i_target, [])
+            for (params, snr, i_model), res in zip(conditions, results):
+                key = self._condition_key(i_target, params, snr, i_model)
+                if stream is not None and key in stream.done:
+                    continue
+                condition_records = self._result_records(
+                    res,
+                    self.models[i_model],
+                    snr,
+                    i_target,
+                    params
+                )
+                if stream is not None:
+                    stream.write(key, condition_records)
+                records.extend(condition_records)
+        return pd.DataFrame([record for i_target in sorted(sentence_records)
+                             for record in sentence_records[i_target]])
+
+    def _conditions(self, n, seed):
+        """Lists the conditions of the experiment.
 
+        Parameters
+        ----------
+        n : int
+            Number of sentences to process.
+        seed : int
+            Seed for the random number generator.
+
+        Returns
+        -------
+        generator
+            Generator of the arguments of :py:func:`_run_condition` for each
+            condition, in the order in which the results are stored.
+        """
         targets = self.material.load_files(n)
-        # Initialize the dataframe in which the results are saved.
-        df = pd.DataFrame()
-        for ii, ((i_target, target), params, snr, model) \
+        for ii, ((i_target, target), params, snr, i_model) \
                 in enumerate(product(
                 enumerate(targets),
                 self.dist_params,
                 self.snrs,
-                self.models
+                range(len(self.models))
         )):
-            log.debug("Running with parameters {}".format(params))
-            masker = self.next_masker(target, params)
+            yield ii, i_target, target, params, snr, i_model, seed
 
-            target, mix, masker = self.preprocessing(
-                target,
-                masker,
-                snr,
-                params
-            )
-            log.info("Simulation # %s\t SNR: %s, sentence %s", ii, snr,
-                     i_target)
-            res = self.prediction(model, target, mix, masker)
+    def _run_condition(self, ii, i_target, target, params, snr, i_model,
+                       seed):
+        """Runs a single condition of the experiment.
+
+        The random number generator is seeded with the seed of the
+        experiment and the number of the condition, such that the result of
+        a condition does not depend on the order in which the conditions are
+        run.
+
+        Parameters
+        ----------
+        ii : int
+            Number of the condition.
+        i_target : int
+            Number of the target sentence.
+        target : ndarray
+            Target sentence.
+        params : object
+            Parameters of the distortion.
+        snr : float
+            SNR of the condition.
+        i_model : int
+            Index of the model in `self.models`.
+        seed : int
+            Seed of the experiment. No seeding is done if it is `None`.
 
-            df = self.append_results(
-                df,
+        Returns
+        -------
+        res : dict
+            Prediction of the model.
+        """
+        if seed is not None:
+            np.random.seed([seed, ii])
+        log.debug("Running with parameters {}".format(params))
+        masker = self.next_masker(target, params)
+
+        target, mix, masker = self.preprocessing(
+            target,
+            masker,
+            snr,
+            params
+        )
+        log.info("Simulation # %s\t SNR: %s, sentence %s", ii, snr,
+                 i_target)
+        return self.prediction(self.models[i_model], target, mix, masker)
+
+    def _single_run(self, n, seed, stream=None):
+        """ Run the experiment locally using a for-loop.
+
+        Parameters
+        ----------
+        n : int
+            Number of sentences to process.
+        seed : int
+            Seed for the random number generator. Default is 0.
+        stream : _ResultStream, optional
+            Where the results are written as they come. The conditions that
+            are already in its manifest are skipped.
+
+        Returns
+        -------
+            Pandas dataframe with the experimental results.
+        """
+        # The rows are collected in a list and the dataframe is created once
+        # all the conditions are done.
+        records = []
+        for condition in self._conditions(n, seed):
+            _, i_target, _, params, snr, i_model, _ = condition
+            key = self._condition_key(i_target, params, snr, i_model)
+            if stream is not None and key in stream.done:
+                continue
+            res = self._run_condition(*condition)
+
+            condition_records = self._result_records(
                 res,
-                model,
+                self.models[i_model],
                 snr,
                 i_target,
                 params
             )
+            if stream is not None:
+                stream.write(key, condition_records)
+            records.extend(condition_records)
+        return pd.DataFrame(records)
+
+    def _process_run(self, n, seed, n_workers=None, stream=None):
+        """ Run the experiment in parallel, in a pool of processes.
+
+        The experiment, with its models and material, is sent once to each
+        worker process. The workers then only receive the numbers of the
+        sentences to process, load the sentences from disk, and run all the
+        conditions of a sentence. The results of a sentence are written as
+        soon as it is done, and the returned results are in the same order
+        as with :py:func:`_single_run`.
+
+        Parameters
+        ----------
+        n : int
+            Number of sentences to process.
+        seed : int
+            Seed for the random number generator.
+        n_workers : int, optional
+            Number of worker processes. The default is the number of CPUs.
+        stream : _ResultStream, optional
+            Where the results are written as they come.
+
+        Returns
+        -------
+            Pandas dataframe with the experimental results.
+        """
+        i_targets = self._pending_targets(n, stream)
+        tasks = [(i_target, seed) for i_target in i_targets]
+        pool = multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                    initargs=(self,))
+        try:
+            # The sentences are written as soon as they are done, so that a
+            # slow sentence does not hold back the others.
+            df = self._collect_results(
+                pool.imap_unordered(_worker_run_sentence, tasks),
+                stream=stream)
+        except BaseException:
+            # Do not wait for the remaining sentences if a worker failed or
+            # the run was interrupted.
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
         return df
 
     def run(self, n=None, seed=0, parallel=False, profile=None,
-            output_filename=None):
+            output_filename=None, n_workers=None, resume=False):
         """ Run the experiment.
 
         Parameters
@@ -384,20 +813,41 @@ class Experiment(object):
         n : int
             Number of sentences to process.
         seed : int
-            Seed for the random number generator. Default is 0.
-        parallel : bool
+            Seed for the random number generator. Default is 0. Each
+            condition is seeded with the seed and the number of the
+            condition, such that the local and the parallel runs give the
+            same results.
+        parallel : bool or str
             If False, the experiment is ran locally, using a for-loop. If
-            True, we use IPython.parallel to run the experiment in parallel.
-            We try to connect to the current profile.
+            'processes', the experiment is ran in parallel in a pool of
+            local processes. If True, we use IPython.parallel to run the
+            experiment in parallel. We try to connect to the current profile.
         output_filename : string
             Name of the output file where the results will be saved. If it is
             `None`, the default is to use the current date and time. The
             default is `None`.
+        n_workers : int, optional
+            Number of worker processes if `parallel` is 'processes'. The
+            default is the number of CPUs.
+        resume : bool, optional
+            If True, continue the run written to `output_filename`: the
+            conditions already in the file are not run again. The default is
+            False, which overwrites the file.
 
         Returns
         -------
         df : pd.Dataframe
-            Pandas dataframe with the experimental results.
+            Pandas dataframe with the experimental results. When resuming,
+            the results read back from the file come first, without the
+            full model predictions.
+
+        Notes
+        -----
+        If `write` is True, the results are appended to the CSV file after
+        each condition, and the conditions done are listed in a manifest
+        next to it, with the extension `.done`. An interrupted run can then
+        be resumed by calling `run` again with the same parameters,
+        `output_filename`, and `resume=True`.
 
         """
         try:
@@ -405,36 +855,51 @@ class Experiment(object):
         except TypeError:
             self.models = (self.models,)
 
-        if parallel:
-            df = self._parallel_run(n, seed, profile=profile)
-        else:
-            df = self._single_run(n, seed)
-
+        stream = None
         if self.write:
-            self._write_results(df, filename=output_filename)
+            if resume and output_filename is None:
+                raise ValueError("The `output_filename` of the run to resume "
+                                 "is required.")
+            columns = [c for c in self._result_columns()
+                       if c != self._key_full_pred]
+            stream = _ResultStream(self._output_file(output_filename),
+                                   columns,
+                                   exclude=[self._key_full_pred],
+                                   resume=resume)
+        try:
+            if parallel == 'processes':
+                df = self._process_run(n, seed, n_workers=n_workers,
+                                       stream=stream)
+            elif parallel:
+                df = self._parallel_run(n, seed, profile=profile,
+                                        stream=stream)
+            else:
+                df = self._single_run(n, seed, stream=stream)
+        finally:
+            if stream is not None:
+                stream.close()
+
+        if stream is not None:
+            log.info('Saved CSV file to location: {}'.format(stream.path))
+            if stream.previous is not None:
+                df = pd.concat([stream.previous, df], ignore_index=True)
         return df
 
-    def _write_results(self, df, filename=None):
-        """Writes results to CSV file.
+    def _output_file(self, filename=None):
+        """Path of the output CSV file.
 
-        Will drop the column where all the complete model output is stored
-        before writing to disk.
+        The output directory is created if it does not exist.
 
         Parameters
         ----------
-        df : dataframe
+        filename : str, optional
+            Name of the file. The default is to use the current date and
+            time, followed by the name of the experiment.
 
         Returns
         -------
-        filepath : str
+        str
             Path to the CSV file.
-
-        Raises
-        ------
-        IOError : Raise if the path where to write the CSV file is not
-        accessible. Additionally, the function tries to save the CSV file to
-        the current directory, in order not to loose the simulation data.
-
         """
         if filename is None:
             timestamp = datetime.now()
@@ -452,27 +917,7 @@ class Experiment(object):
             except IOError as e:
                 log.error("Could not create directory %s", self.output_path)
                 log.error(e)
-
-        output_file = os.path.join(self.output_path, filename)
-        try:
-            df.drop(self._key_full_pred, axis=1).to_csv(output_file)
-            log.info('Saved CSV file to location: {}'.format(output_file))
-        except IOError as e:
-            try:
-                alternate_path = os.path.join(os.getcwd(), filename)
-                err_msg = 'Could not write CSV file to path: {}, tried to ' \
-                          'save to ' \
-                          '{} in order not to loose data.'.format(
-                    output_file, alternate_path)
-                log.error(err_msg)
-                raise
-            finally:
-                try:
-                    df.drop(self._key_full_pred, axis=1).to_csv(alternate_path)
-                except:
-                    pass
-        else:
-            return output_file
+        return os.path.join(self.output_path, filename)
 
     @staticmethod
     def prediction(model, target, mix, masker):
@@ -533,10 +978,15 @@ class Experiment(object):
                      ylabel='% Intelligibility',
                      ax=None
     ):
-        df = df.convert_objects()
         # Drop the column with the full prediction results
         if self._key_full_pred in df.columns:
             df = df.drop(self._key_full_pred, axis=1)
+        # Convert the numbers stored as objects. The columns without values,
+        # e.g. unused distortion parameters, are kept as they are.
+        df = df.copy()
+        for column in df.columns:
+            if df[column].dtype == object and df[column].notnull().any():
+                df[column] = pd.to_numeric(df[column], errors='ignore')
 
         groups = self._get_groups(df, var)
 
@@ -647,6 +1097,8 @@ class Experiment(object):
         """
         snrs = df['SNR'].unique()
         averaging_groups = self._get_groups(df)
+        if self._key_output not in averaging_groups:
+            averaging_groups.append(self._key_output)
         # Average across sentence
         mean_df = df.groupby(averaging_groups).mean().reset_index()
 
@@ -660,7 +1112,7 @@ class Experiment(object):
                            for pair in model_output_pairs}
         # Override for specified models
         if model_srts is not None:
-            for (model, output), criterion in model_srts.iteritems():
+            for (model, output), criterion in six.iteritems(model_srts):
                 transformations[(model, output)] = partial(int2srt, snrs,
                                                            srt_at=criterion)
 
@@ -668,15 +1120,18 @@ class Experiment(object):
         condition_groups = list(set(averaging_groups) - {'Model', 'Output'}
                                 | {'model_output_pair'})
         agg_groups = list(set(condition_groups) - {'model_output_pair', 'SNR'})
-        srts = mean_df.set_index(condition_groups) \
-            .unstack('model_output_pair')[col].reset_index() \
-            .groupby(agg_groups).agg(transformations)
+        unstacked = mean_df.set_index(condition_groups) \
+            .unstack('model_output_pair')[col].reset_index()
+        conditions = [unstacked[group] for group in agg_groups]
+        srts = pd.DataFrame({
+            pair: unstacked[pair].groupby(conditions).agg(transformation)
+            for pair, transformation in six.iteritems(transformations)})
         srts = pd.melt(srts.reset_index(),
                        id_vars=agg_groups,
                        var_name=['Model', 'Output'],
                        value_name='SRT'
         )
-        srts.sort('Model', inplace=True)
+        srts.sort_values('Model', inplace=True)
         return srts
 
 class AdaptiveExperiment(Experiment):
@@ -723,8 +1178,8 @@ class AdaptiveExperiment(Experiment):
         np.random.seed(seed)
 
         targets = self.material.load_files(n)
-        # Initialize the dataframe in which the results are saved.
-        df = pd.DataFrame()
+        # Initialize the list in which the results are saved.
+        records = []
         for ii, ((i_target, target), params, model_and_keys) \
                 in enumerate(product(
                                      enumerate(targets),
@@ -788,8 +1243,7 @@ class AdaptiveExperiment(Experiment):
 
             srt = np.mean([each[0] for each in all_res[-self.n_test_reversals:]])
 
-            df = self.append_results(
-                df,
+            records.extend(self._result_records(
                 res,
                 model,
                 snr,
@@ -797,8 +1251,8 @@ class AdaptiveExperiment(Experiment):
                 params,
                 SRT=srt,
                 Reversals=total_reversals
-            )
-        return df
+            ))
+        return pd.DataFrame(records)
 
 
 
@@ -807,7 +1261,7 @@ class AdaptiveExperiment(Experiment):
 
 
 def srt_dict_to_dataframe(d):
-    df_srts = pd.DataFrame()
+    records = []
     for k, v in six.iteritems(d):
         model, material, tdist, mdist = k.split('_')
 
@@ -816,13 +1270,13 @@ def srt_dict_to_dataframe(d):
         except TypeError:
             srt = np.nan
 
-        df_srts = df_srts.append({'model': model,
-                                  'tidst': tdist,
-                                  'mdist': mdist,
-                                  'srt': srt},
-                                 ignore_index=True)
-    df_srts = df_srts.convert_objects(convert_numeric=True, )
-    return df_srts.sort(['model', 'mdist'])
+        records.append({'model': model,
+                        'tidst': tdist,
+                        'mdist': mdist,
+                        'srt': srt})
+    df_srts = pd.DataFrame(records, columns=['model', 'tidst', 'mdist', 'srt'])
+    df_srts = df_srts.apply(pd.to_numeric, errors='ignore')
+    return df_srts.sort_values(['model', 'mdist'])
 
 
 def plot_srt_dataframe(df):
@@ -40,6 +40,18 @@ class Material(object):
         self.path_to_ssn = path_to_ssn
         self.force_mono = force_mono
 
+    def __getstate__(self):
+        # The speech-shaped noise is not pickled, e.g. when the material is
+        # sent to parallel workers. It is loaded again from its path instead.
+        state = self.__dict__.copy()
+        state['_ssn'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._path_to_ssn is not None:
+            self._ssn = self._load_ssn()
+
     @property
     def files(self):
         return self.files_list()
@@ -204,6 +216,139 @@ class Material(object):
         return np.mean(spl), np.std(spl)
 
 
+class MappedMaterial(Material):
+    """Speech material stored in memory-mapped arrays.
+
+    All the sentences of the material are concatenated in a single `.npy`
+    file, next to an index of the offset of each sentence, and the
+    speech-shaped noise is stored in a second `.npy` file. The files are
+    opened as read-only memory maps, so that the processes of a parallel
+    experiment share a single copy of the corpus in the page cache instead
+    of each loading the whole material. When pickled, only the path to the
+    corpus is sent to the workers, which map the files again.
+
+    A corpus is created from an existing material with :py:meth:`create`.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the corpus.
+    fs : int, optional
+        Sampling frequency of the material, in Hz. Default is 22050 Hz.
+    ref_level : float, optional
+        Level, in dB SPL, at which the sentences are recorded.
+    name : str, optional
+        Name of the speech material.
+    force_mono : bool, optional
+        Return only one channel of the speech-shaped noise if it is stereo.
+    """
+
+    _sentences_file = 'sentences.npy'
+    _offsets_file = 'offsets.npy'
+    _names_file = 'names.npy'
+    _ssn_file = 'ssn.npy'
+
+    def __init__(self,
+                 path,
+                 fs=22050,
+                 ref_level=74,
+                 name='CLUE',
+                 force_mono=False):
+        self.fs = fs
+        self.path_to_sentences = path
+        self.path_to_maskers = None
+        self.ref_level = ref_level
+        self.name = name
+        self.force_mono = force_mono
+        self._ssn = None
+        self._path_to_ssn = None
+        self.path_to_ssn = os.path.join(path, self._ssn_file)
+        self._open()
+
+    @classmethod
+    def create(cls, material, path, n=None):
+        """Write a speech material to a memory-mapped corpus.
+
+        Parameters
+        ----------
+        material : Material
+            Speech material to copy.
+        path : str
+            Directory where the corpus is written. It is created if it does
+            not exist.
+        n : int, optional
+            Number of sentences to copy. Default (`None`) is to copy all the
+            sentences of the material.
+
+        Returns
+        -------
+        MappedMaterial
+            Material reading from the new corpus.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        names = list(material.files)[:n]
+        sentences = [material.load_file(name) for name in names]
+        offsets = np.cumsum([0] + [s.shape[-1] for s in sentences])
+        np.save(os.path.join(path, cls._sentences_file),
+                np.concatenate(sentences, axis=-1))
+        np.save(os.path.join(path, cls._offsets_file), offsets)
+        np.save(os.path.join(path, cls._names_file), np.array(names))
+        np.save(os.path.join(path, cls._ssn_file), material._ssn)
+        return cls(path, fs=material.fs, ref_level=material.ref_level,
+                   name=material.name, force_mono=material.force_mono)
+
+    def _open(self):
+        path = self.path_to_sentences
+        self._sentences = np.load(os.path.join(path, self._sentences_file),
+                                  mmap_mode='r')
+        self._offsets = np.load(os.path.join(path, self._offsets_file))
+        names = np.load(os.path.join(path, self._names_file))
+        self._index = dict((str(name), ii) for ii, name in enumerate(names))
+        self._names = [str(name) for name in names]
+
+    def __getstate__(self):
+        state = Material.__getstate__(self)
+        for key in ('_sentences', '_offsets', '_index', '_names'):
+            state[key] = None
+        return state
+
+    def __setstate__(self, state):
+        Material.__setstate__(self, state)
+        self._open()
+
+    def _load_ssn(self):
+        return np.load(self.path_to_ssn, mmap_mode='r')
+
+    def files_list(self):
+        """Return a list of all the sentences in the corpus.
+
+        Returns
+        -------
+        list of str
+            Names of the sentences, in the order of the corpus.
+        """
+        return list(self._names)
+
+    def load_file(self, filename):
+        """Read a sentence of the corpus by name.
 
+        Parameters
+        ----------
+        filename : string
+            Name of the sentence, as in `files`.
 
+        Returns
+        -------
+        ndarray
+            Copy of the sentence, as floating point array.
+        """
+        ii = self._index[filename]
+        start, stop = self._offsets[ii], self._offsets[ii + 1]
+        return np.array(self._sentences[..., start:stop])
 
+    def ssn(self, x=None):
+        # Return a copy, rather than a read-only view of the memory map, since
+        # the maskers are modified during the experiments.
+        return np.array(Material.ssn(self, x))
+    ssn.__doc__ = Material.ssn.__doc__
@@ -9,6 +9,152 @@ from pambox import central
 from pambox import inner
 
 
+class MrPowers(object):
+    """Multi-resolution values, stored as a flat array of segments.
+
+    Each modulation channel has a different number of segments. Instead of
+    padding all modulation channels to the longest one, the segments of all
+    modulation channels are concatenated along the last axis of `data`, low
+    modulation frequencies first. Arithmetic can then be done on `data`
+    directly, as a contiguous array.
+
+    Parameters
+    ----------
+    data : ndarray
+        Values of the segments, of shape (..., N_TOTAL), where N_TOTAL is
+        the sum of `n_segments`.
+    n_segments : array_like
+        Number of segments in each modulation channel.
+
+    Attributes
+    ----------
+    offsets : ndarray
+        Index of the first segment of each modulation channel in `data`. The
+        last element is N_TOTAL.
+
+    Examples
+    --------
+
+    The values of a single channel can be indexed like an array, and each
+    modulation channel is accessible individually, e.g. for plotting:
+
+    >>> chan_powers = res['mr_exc_ptns'][1, 5]
+    >>> [band.max() for band in chan_powers.bands()]
+
+    """
+
+    def __init__(self, data, n_segments):
+        self.data = np.asarray(data)
+        self.n_segments = np.asarray(n_segments, dtype='int')
+        self.offsets = np.concatenate(([0], np.cumsum(self.n_segments)))
+        if self.data.shape[-1] != self.offsets[-1]:
+            raise ValueError("The last dimension of the data must be the "
+                             "total number of segments.")
+
+    @classmethod
+    def from_masked(cls, mr_values):
+        """Creates multi-resolution values from a masked array.
+
+        Parameters
+        ----------
+        mr_values : masked_array
+            Values of shape (..., N_MODF, N_SEG). The visible segments of a
+            modulation channel must come first, and must be the same for
+            all the leading dimensions.
+
+        Returns
+        -------
+        MrPowers
+
+        """
+        mask = np.ma.getmaskarray(mr_values)
+        n_segments = (~mask).reshape((-1,) + mask.shape[-2:])[0].sum(axis=-1)
+        data = np.ma.getdata(mr_values)
+        return cls(np.concatenate([data[..., i_modf, :n_seg] for i_modf, n_seg
+                                   in enumerate(n_segments)], axis=-1),
+                   n_segments)
+
+    def to_masked(self):
+        """Converts the values to a masked array.
+
+        Returns
+        -------
+        masked_array
+            Values of shape (..., N_MODF, N_SEG), where N_SEG is the largest
+            number of segments. The missing segments are masked.
+
+        """
+        shape = self.data.shape[:-1] + (len(self.n_segments),
+                                         np.max(self.n_segments))
+        data = np.zeros(shape, dtype=self.data.dtype)
+        mask = np.ones(shape, dtype=bool)
+        for i_modf, band in enumerate(self.bands()):
+            n_seg = band.shape[-1]
+            data[..., i_modf, :n_seg] = band
+            mask[..., i_modf, :n_seg] = False
+        return np.ma.MaskedArray(data, mask)
+
+    def band(self, i_modf):
+        """Returns the segments of a modulation channel.
+
+        Parameters
+        ----------
+        i_modf : int
+            Index of the modulation channel.
+
+        Returns
+        -------
+        ndarray
+            View of the values, of shape (..., N_SEG) where N_SEG is the
+            number of segments of the modulation channel.
+
+        """
+        return self.data[..., self.offsets[i_modf]:self.offsets[i_modf + 1]]
+
+    def bands(self):
+        """Returns the segments of all the modulation channels.
+
+        Returns
+        -------
+        list of ndarrays
+            Views of the values of each modulation channel.
+
+        """
+        return [self.band(i_modf) for i_modf in range(len(self.n_segments))]
+
+    def mean(self):
+        """Averages the values of each modulation channel over time.
+
+        Returns
+        -------
+        ndarray
+            Average values, of shape (..., N_MODF).
+
+        """
+        sums = np.add.reduceat(self.data, self.offsets[:-1], axis=-1)
+        return sums / self.n_segments
+
+    def __getitem__(self, idx):
+        """Indexes the leading dimensions, e.g. the signals and channels."""
+        if not isinstance(idx, tuple):
+            idx = (idx,)
+        return MrPowers(self.data[idx + (Ellipsis, slice(None))],
+                        self.n_segments)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def shape(self):
+        """Shape of the leading dimensions, followed by the number of
+        modulation channels."""
+        return self.data.shape[:-1] + (len(self.n_segments),)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+
 class MrSepsm(Sepsm):
     """Multi-resolution envelope power spectrum model (mr-sEPSM).
 
@@ -34,7 +180,19 @@ class MrSepsm(Sepsm):
         Name of the model.
     output_time_signals : bool, optional
         Output the time signals signals in the results dictionary. Adds the
-        keys 'chan_sigs', 'chan_envs', and 'filtered_envs'.
+        keys 'chan_sigs', 'chan_envs', and 'filtered_envs'. The 'chan_envs'
+        are the low-pass filtered envelopes at the full sampling rate, and
+        the 'filtered_envs' are at the downsampled rate.
+    dtype : str or dtype, optional, (Default value = 'float64')
+        Floating-point type used throughout the model. See
+        :py:class:`~pambox.speech.Sepsm` for the accuracy of 'float32'.
+    chan_block_size : int, optional, (Default value = 4)
+        Number of peripheral channels processed together. See
+        :py:class:`~pambox.speech.Sepsm`. All the channels are processed at
+        once if `output_time_signals` is `True`.
+    env_cache_size : int, optional, (Default value = 8)
+        Number of input signals whose subband envelopes are cached. See
+        :py:class:`~pambox.speech.Sepsm`.
 
     References
     ----------
@@ -55,10 +213,18 @@ class MrSepsm(Sepsm):
                  snr_env_ceil=None,
                  min_win=None,
                  name='MrSepsm',
-                 output_time_signals=False
+                 output_time_signals=False,
+                 dtype='float64',
+                 chan_block_size=4,
+                 env_cache_size=8
                  ):
         Sepsm.__init__(self, fs, cf, modf, downsamp_factor, noise_floor,
-                       snr_env_limit)
+                       snr_env_limit, dtype=dtype,
+                       chan_block_size=chan_block_size,
+                       env_cache_size=env_cache_size)
+        # The multi-resolution powers are calculated from the time outputs
+        # of the modulation filterbank.
+        self.mod_fb.output_time = True
         self.min_win = min_win
         self.name = name
         self.snr_env_ceil = snr_env_ceil
@@ -70,19 +236,19 @@ class MrSepsm(Sepsm):
         Parameters
         ----------
         channel_env : ndarray
-            Envelope of the peripheral channel. The shape should be (N_SIG,
-            N_CHAN, N)
+            Downsampled envelope of the peripheral channel. The shape should
+            be (N_SIG, N_CHAN, N)
         filtered_envs : ndarray
             Filtered envelope. The shape should be (N_SIG, N_CHAN, N_MODF, N)
 
         Returns
         -------
-        mr_env_powers : masked_array
-            Multi-resolution envelope powers of shape (N_SIG, N_CHAN, N_MODF,
-            N_SEG), where N_SEG is the maximum number of segments in the
-            multi-resolution process, which is for the highest modulation
-            center frequency. For a 1 sec sample, it is about 400 segments.
-            Low modulation frequencies come first.
+        mr_env_powers : MrPowers
+            Multi-resolution envelope powers of shape (N_SIG, N_CHAN,
+            N_TOTAL), where N_TOTAL is the total number of segments of all
+            the modulation channels. The highest modulation center frequency
+            has the most segments: for a 1 sec sample, it is about 400
+            segments. Low modulation frequencies come first.
 
         """
         # Here we find the duration and the number of windows for each
@@ -97,46 +263,39 @@ class MrSepsm(Sepsm):
 
         # ... then we calculate the DC power used for the normalization.
         # We divide it by 2 such that a fully modulated signal has an
-        # AC-power of 1...
+        # AC-power of 1. It is the mean of the downsampled envelopes...
         dc_power = np.mean(channel_envs, axis=-1) ** 2 / 2
 
-        # ... then we create a masked array of zeros, where all entries are
-        # hidden...
-        mr_env_powers = np.ma.masked_all(
-            (filtered_envs.shape[:-1] + (np.max(n_segments),))
-        )
-
-        # ... and start looping throug the input signals...
-        for i_sig, sig_envs in enumerate(filtered_envs):
-            # ... and the channels...
-            for i_chan, chan_envs in enumerate(sig_envs):
-                # ... and the modulation channels, zipped with the window
-                # lengths and number of segments...
-                for i_modf, (n_seg, win_length, env) in enumerate(
-                        zip(n_segments, win_lengths, chan_envs)):
-                    n_complete_seg = n_seg - 1
-                    last_idx = int(n_complete_seg * win_length)
-                    # ... we reshape to n_seg x win_length so that we can
-                    # calculate the variance in a single operation...
-                    tmp_env = env[:last_idx].reshape((-1, win_length))
-                    # ... then we normalize the variance by N-1, like in MATLAB.
-                    tmp_env_powers = np.var(tmp_env, axis=-1, ddof=1) / \
-                                     dc_power[i_sig, i_chan]
-                    # ... and treat the last segment independently, just in
-                    # case it is not # complete, i.e. it is shorter than the
-                    # window length.
-                    tmp_env_powers_last = np.var(env[last_idx:], ddof=1) / \
-                                          dc_power[i_sig, i_chan]
-                    # ... then we save it in our masked_array...
-                    mr_env_powers[i_sig, i_chan, i_modf, :n_complete_seg] = \
-                        tmp_env_powers
-                    mr_env_powers[i_sig, i_chan, i_modf, n_complete_seg] = \
-                        tmp_env_powers_last
-                    # ... and finally make these values visible through the
-                    # mask.
-                    mr_env_powers.mask[i_sig, i_chan, i_modf, :n_seg] = False
-
-        mr_env_powers[np.isnan(mr_env_powers) & ~mr_env_powers.mask] = 0
+        # ... then we create a flat array for the segments of all the
+        # modulation channels...
+        offsets = np.concatenate(([0], np.cumsum(n_segments)))
+        powers = np.empty(filtered_envs.shape[:-2] + (offsets[-1],),
+                          dtype=filtered_envs.dtype)
+
+        # ... and loop through the modulation channels only. All the signals
+        # and audio channels are processed at once.
+        for i_modf, (n_seg, win_length) in enumerate(zip(n_segments,
+                                                         win_lengths)):
+            env = filtered_envs[..., i_modf, :]
+            n_complete_seg = n_seg - 1
+            last_idx = int(n_complete_seg * win_length)
+            offset = offsets[i_modf]
+            # The complete segments are a (N_SIG, N_CHAN, N_SEG - 1,
+            # win_length) view of the envelopes, so that the variances are
+            # calculated in a single operation. They are normalized by N-1,
+            # like in MATLAB...
+            segments = env[..., :last_idx].reshape(
+                env.shape[:-1] + (n_complete_seg, win_length))
+            powers[..., offset:offset + n_complete_seg] = \
+                np.var(segments, axis=-1, ddof=1)
+            # ... and the last segment is treated independently, in case it
+            # is shorter than the window length.
+            powers[..., offset + n_complete_seg] = \
+                np.var(env[..., last_idx:], axis=-1, ddof=1)
+
+        powers /= dc_power[..., np.newaxis]
+        powers[np.isnan(powers)] = 0
+        mr_env_powers = MrPowers(powers, n_segments)
         return mr_env_powers
 
     @staticmethod
@@ -145,31 +304,36 @@ class MrSepsm(Sepsm):
 
         Parameters
         ----------
-        mr_snr_env : ndarray
+        mr_snr_env : MrPowers
+            Multi-resolution SNRenv.
 
         Returns
         -------
         ndarray
+            SNRenv averaged over time, of shape (..., N_MODF).
 
         """
-        return mr_snr_env.mean(axis=-1)
+        return mr_snr_env.mean()
 
     def _mr_snr_env(self, p_mix, p_noise):
         """Calculates the multi-resolution SNRenv.
 
         Parameters
         ----------
-        p_mix, p_noise : ndarrays
+        p_mix, p_noise : MrPowers
             Envelope power of the mixture and of the noise alone.
 
         Returns
         -------
-        mr_snr_env : masked_array
-            Multi-resolution `masked_array` of SNRenv.
-        exc_ptns : list of masked_arrays
+        mr_snr_env : MrPowers
+            Multi-resolution SNRenv.
+        exc_ptns : list of MrPowers
             Multi-resolution values of the mixture and of the noise alone.
 
         """
+        n_segments = p_mix.n_segments
+        p_mix = p_mix.data
+        p_noise = p_noise.data
 
         # First we limit the noise such that it cannot exceed the mix,
         # since they exist at the same time...
@@ -187,7 +351,8 @@ class MrSepsm(Sepsm):
         if self.snr_env_ceil is not None:
             mr_snr_env = np.minimum(mr_snr_env, self.snr_env_ceil)
 
-        return mr_snr_env, [p_mix, p_noise]
+        return MrPowers(mr_snr_env, n_segments), \
+            [MrPowers(p_mix, n_segments), MrPowers(p_noise, n_segments)]
 
     def predict(self, clean=None, mix=None, noise=None):
         """Predicts intelligibility using the mr-sEPSM.
@@ -218,11 +383,21 @@ class MrSepsm(Sepsm):
             signals = np.vstack((mix, noise))
         else:
             signals = np.vstack((clean, mix, noise))
+        signals = signals.astype(self.dtype, copy=False)
 
-        bands_above_thres_idx = self._find_bands_above_thres(mix)
-        channel_sigs = self._peripheral_filtering(signals)
-        channel_envs = self._extract_env(channel_sigs)
-        channel_envs = self._mod_sensitivity(channel_envs)
+        bands_above_thres_idx = self._find_bands_above_thres(mix, clean,
+                                                             noise)
+        if self.output_time_signals:
+            # The full-rate subband signals and envelopes are part of the
+            # output. Keeping every `downsamp_factor`-th sample of the
+            # low-pass filtered envelopes gives the same envelopes as
+            # :py:func:`_mod_sensitivity`.
+            channel_sigs = self._peripheral_filtering(signals)
+            full_rate_envs = inner.lowpass_env_filtering(
+                self._extract_env(channel_sigs), 150.0, n=1, fs=self.fs)
+            channel_envs = full_rate_envs[..., ::self.downsamp_factor]
+        else:
+            channel_envs = self._cached_channel_envelopes(signals)
         filtered_envs, lt_exc_ptns = self._mod_filtering(channel_envs)
         mr_exc_ptns = self._mr_env_powers(channel_envs, filtered_envs)
         mr_snr_env_matrix, _ = self._mr_snr_env(
@@ -257,11 +432,71 @@ class MrSepsm(Sepsm):
         }
         if self.output_time_signals:
             res['chan_sigs'] = channel_sigs
-            res['chan_envs'] = channel_envs
+            res['chan_envs'] = full_rate_envs
             res['filtered_envs'] = filtered_envs
         return res
 
 
+    def predict_batch(self, clean=None, mix=None, noise=None, lengths=None,
+                      batch_size=8):
+        """Predicts intelligibility for many conditions.
+
+        Unlike the sEPSM, the mr-sEPSM is not batched: :py:func:`predict` is
+        called on each item, and the results are gathered. The segments of
+        the multi-resolution powers depend on the length of the signals,
+        which differs between items.
+
+        Parameters
+        ----------
+        clean : ndarray (optional)
+            Clean speech signals, of shape (N_ITEMS, N). Optional.
+        mix : ndarray
+            Mixtures of the processed speech and noise, of shape (N_ITEMS,
+            N).
+        noise : ndarray
+            Processed noise signals alone, of shape (N_ITEMS, N).
+        lengths : array_like, optional
+            Length of each item, if the items have different lengths. The
+            item `i` is made of the first ``lengths[i]`` samples of each
+            signal, and the rest is ignored. By default, all the items have
+            N samples.
+        batch_size : int, optional
+            Ignored. Kept for compatibility with
+            :py:func:`~pambox.speech.Sepsm.predict_batch`.
+
+        Returns
+        -------
+        res : dict
+            Dictionary of the model predictions, with the same keys as the
+            output of :py:func:`predict`. The values of 'p', the
+            'snr_env_matrix', the 'lt_snr_env_matrix', and the 'lt_exc_ptns'
+            are stacked in arrays whose first dimension is N_ITEMS. The other
+            values are lists with one item per condition.
+
+        """
+        mix = np.asarray(mix)
+        noise = np.asarray(noise)
+        if clean is not None:
+            clean = np.asarray(clean)
+        if lengths is None:
+            lengths = np.full(mix.shape[0], mix.shape[-1], dtype='int')
+
+        items = []
+        for i_item, length in enumerate(lengths):
+            item_clean = None if clean is None else clean[i_item, :length]
+            items.append(self.predict(item_clean, mix[i_item, :length],
+                                      noise[i_item, :length]))
+
+        stacked = ('snr_env_matrix', 'lt_snr_env_matrix', 'lt_exc_ptns')
+        res = {'p': dict((k, np.array([item['p'][k] for item in items]))
+                         for k in items[0]['p'])}
+        for k in items[0]:
+            if k in stacked:
+                res[k] = np.stack([item[k] for item in items])
+            elif k != 'p':
+                res[k] = [item[k] for item in items]
+        return res
+
     def _optimal_combination(self, snr_env, bands_above_thres_idx):
         """Combines SNRenv across audio and modulation channels.
         
@@ -302,7 +537,8 @@ class MrSepsm(Sepsm):
 
         Parameters
         ----------
-        mat :
+        mat : MrPowers or masked_array
+            Multi-resolution values of a single channel.
         x :
             (Default value = None)
         y : array_like
@@ -319,6 +555,8 @@ class MrSepsm(Sepsm):
 
         """
 
+        if isinstance(mat, MrPowers):
+            mat = mat.to_masked()
         n_y, n_x = mat.shape
         if y is None:
             y = np.arange(n_y)
@@ -370,9 +608,9 @@ class MrSepsm(Sepsm):
 
         Parameters
         ----------
-        ptns : dict
-            Predictions from the model. Must have a `mr_snr_env_matrix`
-            key.
+        ptns : MrPowers or masked_array
+            Multi-resolution envelope powers or SNRenv of a single channel,
+            e.g. ``res['mr_exc_ptns'][1, 5]``.
         dur : bool
             Display dB values of the modulation power or SNRenv values. (Default: True.)
         vmax : float
@@ -402,6 +640,8 @@ class MrSepsm(Sepsm):
         """
 
         mf = self.modf
+        if isinstance(ptns, MrPowers):
+            ptns = ptns.to_masked()
 
         if 'exc_ptns' in attr:
             cbar_label = 'Modulation power'
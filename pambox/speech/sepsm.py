@@ -7,12 +7,46 @@ from mpl_toolkits.axes_grid1 import ImageGrid
 from six.moves import zip
 from pambox import central
 from pambox import inner
+from pambox import utils
 try:
     import seaborn
 except ImportError:
     pass
 
 
+def _scaling_factor(x, ref):
+    """Finds the factor that scales a reference signal to a signal.
+
+    Parameters
+    ----------
+    x, ref : ndarray
+        Signal and reference signal.
+
+    Returns
+    -------
+    float or None
+        Factor `g` such that ``x == g * ref``, to within rounding errors, or
+        `None` if `x` is not a scaled copy of `ref`.
+
+    """
+    if x.shape != ref.shape or x.size == 0:
+        return None
+    i_peak = np.argmax(np.abs(x))
+    if ref[i_peak] == 0:
+        return None
+    gain = x[i_peak] / ref[i_peak]
+    # Allow for the rounding errors of the scaling.
+    tol = 16 * np.finfo(x.dtype).eps * np.abs(x[i_peak])
+    if np.max(np.abs(x - gain * ref)) <= tol:
+        return gain
+    return None
+
+
+def _scale_key(x):
+    """Key of a signal that does not depend on its scale."""
+    return len(x), int(np.argmax(np.abs(x)))
+
+
 class Sepsm(object):
     """Implement the sEPSM intelligibility model [1].
 
@@ -30,6 +64,28 @@ class Sepsm(object):
          (Default value = 0.01)
     snr_env_limit : float
          (Default value = 0.001)
+    dtype : str or dtype, optional
+        Floating-point type used throughout the model, from the peripheral
+        filtering to the modulation powers. 'float32' halves the memory
+        traffic of a prediction. On the validation signals of the test
+        suite, the SNRenv predicted in single precision differs by less than
+        0.1% from the double-precision reference.
+        (Default value = 'float64')
+    chan_block_size : int, optional
+        Number of peripheral channels processed together, from the
+        peripheral filtering to the downsampled envelopes. Only a block of
+        channels is held at the full sampling rate at any time, which bounds
+        the memory used by a prediction. Use `None` to process all the
+        channels at once. (Default value = 4)
+    env_cache_size : int, optional
+        Number of input signals whose subband envelopes are kept in a cache,
+        and number of pairs of clean speech and noise whose band powers are
+        kept in a cache.
+        The front end, from the peripheral filtering to the low-pass
+        filtered envelopes, is linear with respect to the scale of the
+        input, so the envelopes of a scaled copy of a cached signal, e.g. the
+        same target or masker at another level, are obtained by scaling the
+        cached envelopes. Use 0 to disable the cache. (Default value = 8)
 
     Notes
     -----
@@ -67,6 +123,9 @@ class Sepsm(object):
                  , noise_floor=0.01
                  , snr_env_limit=0.001
                  , name='sEPSM'
+                 , dtype='float64'
+                 , chan_block_size=4
+                 , env_cache_size=8
                  ):
         self.fs = fs
         self.cf = cf
@@ -76,33 +135,38 @@ class Sepsm(object):
         self.snr_env_limit = snr_env_limit
         self.ht_diffuse = self._default_ht_diffuse
         self.name = name
+        self.dtype = np.dtype(dtype)
+        self.chan_block_size = chan_block_size
+        self._env_cache = utils.LRUCache(maxsize=env_cache_size)
+        self._band_cache = utils.LRUCache(maxsize=env_cache_size)
+        self._cross_cache = utils.LRUCache(maxsize=env_cache_size)
         self.mod_fb = \
             central.EPSMModulationFilterbank(self.fs / self.downsamp_factor,
-                                             self.modf)
-        self.peripheral_filterbank = inner.GammatoneFilterbank(self.fs, self.cf)
+                                             self.modf, dtype=self.dtype,
+                                             output_time=False)
+        self.peripheral_filterbank = inner.GammatoneFilterbank(
+            self.fs, self.cf, dtype=self.dtype)
         self.noct_filterbank = inner.RectangularFilterbank(self.fs, self.cf,
                                                            width=3)
 
     def _peripheral_filtering(self, signals):
-        """Filters a time signal using a Gammatone filterbank.
+        """Filters time signals using a Gammatone filterbank.
+
+        All the signals are filtered in a single call to the filterbank.
 
         Parameters
         ----------
-        signal : ndarray
-            Signal to filter.
-        center_f : ndarray
-            Center frequencies of the peripheral filters.
+        signals : ndarray
+            Signals to filter. The shape should be (N_SIG, N).
 
         Returns
         -------
         y : ndarray
-            Outputs of the peripheral filterbank.
+            Outputs of the peripheral filterbank. The shape is (N_SIG,
+            N_CHAN, N).
 
         """
-        y = np.zeros((signals.shape[0], len(self.cf), signals.shape[-1]))
-        for i_sig, s in enumerate(signals):
-            y[i_sig] = self.peripheral_filterbank.filter(s)
-        return y
+        return self.peripheral_filterbank.filter(signals)
 
     def _bands_above_thres(self, x):
         """Select bands above threshold accoring to the diffuse field hearing
@@ -193,7 +257,7 @@ class Sepsm(object):
         snr_env = np.sqrt(np.sum(snr_env ** 2))
         return snr_env
 
-    def _find_bands_above_thres(self, mixture):
+    def _find_bands_above_thres(self, mixture, clean=None, noise=None):
         """Find the indexes of the bands that are above hearing threshold.
 
         The signal is filtered using a rectangular third-octave filterbank
@@ -204,6 +268,11 @@ class Sepsm(object):
         ----------
         mixture : ndarray
             1D time signal.
+        clean, noise : ndarray, optional
+            Clean speech and noise alone. If the mixture is their sum, the
+            band powers of the mixture are calculated from cached band
+            powers of the clean speech and of the noise. See
+            :py:func:`_mixture_band_rms`.
 
         Returns
         -------
@@ -216,9 +285,107 @@ class Sepsm(object):
             threshold.
 
         """
-        filtered_rms_mix = self.noct_filterbank.filter(mixture)
+        if clean is None or noise is None:
+            filtered_rms_mix = self.noct_filterbank.filter(mixture)
+        else:
+            filtered_rms_mix = self._mixture_band_rms(clean, mixture, noise)
         return self._bands_above_thres(filtered_rms_mix)
 
+    def _cached_band_powers(self, x):
+        """Finds the cached third-octave band powers of a signal.
+
+        Parameters
+        ----------
+        x : ndarray
+            Signal.
+
+        Returns
+        -------
+        entry : tuple or None
+            Cached reference signal and its band powers, or `None` if no
+            scaled copy of `x` is in the cache.
+        gain : float or None
+            Factor that scales the reference signal to `x`.
+
+        """
+        entry = self._band_cache.get(_scale_key(x))
+        if entry is not None:
+            gain = _scaling_factor(x, entry[0])
+            if gain is not None:
+                return entry, gain
+        return None, None
+
+    def _mixture_band_rms(self, clean, mixture, noise):
+        """Calculates the third-octave band RMS of a mixture.
+
+        The band powers are quadratic in the signal. For a mixture ``a * c +
+        b * n``, where `c` and `n` are reference clean speech and noise, the
+        band powers are:
+
+        .. math::
+
+            P_{mix} = a^2 P_c + b^2 P_n + 2 a b P_{cn},
+
+        where :math:`P_{cn}` is the cross-power of the clean speech and the
+        noise in each band. The band powers :math:`P_c` and :math:`P_n` are
+        cached for each signal, and the cross-power for each pair of clean
+        speech and noise. The same signals at another SNR or level are not
+        filtered again, and a new noise only requires filtering the noise and
+        the mixture.
+
+        Parameters
+        ----------
+        clean, mixture, noise : ndarray
+            Clean speech, mixture, and noise alone. If the mixture is not the
+            sum of the clean speech and of the noise, e.g. after nonlinear
+            processing, it is filtered directly.
+
+        Returns
+        -------
+        ndarray
+            RMS value of each band of the mixture.
+
+        """
+        clean = np.asarray(clean)
+        mixture = np.asarray(mixture)
+        noise = np.asarray(noise)
+        if self._band_cache.maxsize < 1 \
+                or not clean.shape == noise.shape == mixture.shape \
+                or not np.allclose(mixture, clean + noise, rtol=1e-12,
+                                   atol=0):
+            return self.noct_filterbank.filter(mixture)
+
+        entry_clean, a = self._cached_band_powers(clean)
+        entry_noise, b = self._cached_band_powers(noise)
+        pair_key = _scale_key(clean) + _scale_key(noise)
+        if entry_clean is not None and entry_noise is not None:
+            cross = self._cross_cache.get(pair_key)
+            # The cross-power is only valid for the cached reference signals.
+            if cross is not None and cross[0] is entry_clean[0] \
+                    and cross[1] is entry_noise[0]:
+                p_mix = a ** 2 * entry_clean[1] + b ** 2 * entry_noise[1] \
+                    + 2 * a * b * cross[2]
+                return np.sqrt(np.maximum(p_mix, 0))
+
+        # Filter the mixture, and the signals whose band powers are not
+        # cached yet.
+        missing = [x for x, entry in ((clean, entry_clean),
+                                      (noise, entry_noise)) if entry is None]
+        rms = list(self.noct_filterbank.filter(np.vstack([mixture] +
+                                                         missing)))
+        rms_mix = rms.pop(0)
+        if entry_clean is None:
+            entry_clean, a = (clean.copy(), rms.pop(0) ** 2), 1.
+            self._band_cache[_scale_key(clean)] = entry_clean
+        if entry_noise is None:
+            entry_noise, b = (noise.copy(), rms.pop(0) ** 2), 1.
+            self._band_cache[_scale_key(noise)] = entry_noise
+        p_cross = (rms_mix ** 2 - a ** 2 * entry_clean[1]
+                   - b ** 2 * entry_noise[1]) / (2 * a * b)
+        self._cross_cache[pair_key] = (entry_clean[0], entry_noise[0],
+                                       p_cross)
+        return rms_mix
+
     def _extract_env(self, channel_sigs):
         """Calculates the Hilbert envelope.
 
@@ -237,13 +404,14 @@ class Sepsm(object):
         inner.hilbert_envelope : Calculates the Hilbert envelope.
 
         """
-        return inner.hilbert_envelope(channel_sigs)
+        return inner.hilbert_envelope(channel_sigs, dtype=self.dtype)
 
     def _mod_sensitivity(self, envs):
         """Reduces modulation sensitivity using a low-pass filter.
 
         Low-pass filters the envelope using a 1st-order Butterworth filter at
-        150 Hz [1, 2].
+        150 Hz [1, 2], and downsamples it by `downsamp_factor` for faster
+        processing. Both steps are done at once, at the output sampling rate.
 
         Parameters
         ----------
@@ -253,6 +421,7 @@ class Sepsm(object):
         Returns
         -------
         envs : ndarray
+            Low-pass filtered and downsampled envelopes.
 
         References
         ----------
@@ -266,44 +435,128 @@ class Sepsm(object):
 
 
         """
-        return inner.lowpass_env_filtering(envs, 150.0, n=1, fs=self.fs)
+        return inner.lowpass_env_decimation(envs, self.downsamp_factor, 150.0,
+                                            n=1, fs=self.fs)
+
+    def _channel_envelopes(self, signals):
+        """Calculates the downsampled subband envelopes of signals.
+
+        Applies the peripheral filtering, the envelope extraction, and the
+        modulation low-pass filter to blocks of `chan_block_size` channels at
+        a time. Only the downsampled envelopes of all the channels are kept.
+
+        Parameters
+        ----------
+        signals : ndarray
+            Signals to process. The shape should be (N_SIG, N).
+
+        Returns
+        -------
+        channel_envs : ndarray
+            Low-pass filtered and downsampled subband envelopes. The shape is
+            (N_SIG, N_CHAN, N_DOWN), where N_DOWN is the length of the
+            downsampled envelopes.
+
+        """
+        n_chan = len(self.cf)
+        block_size = self.chan_block_size or n_chan
+        channel_envs = None
+        for start in range(0, n_chan, block_size):
+            chans = slice(start, start + block_size)
+            channel_sigs = self.peripheral_filterbank.filter(signals,
+                                                             channels=chans)
+            block_envs = self._mod_sensitivity(
+                self._extract_env(channel_sigs))
+            del channel_sigs
+            if channel_envs is None:
+                channel_envs = np.empty(
+                    block_envs.shape[:-2] + (n_chan, block_envs.shape[-1]),
+                    dtype=block_envs.dtype)
+            channel_envs[..., chans, :] = block_envs
+        return channel_envs
+
+    def _cached_channel_envelopes(self, signals):
+        """Calculates the downsampled subband envelopes, using the cache.
+
+        A signal that is a scaled copy of a signal in the cache, e.g. the
+        same masker at a different level, is not processed again: its
+        envelopes are the cached envelopes, scaled by the absolute value of
+        the scaling factor. The other signals are processed with
+        :py:func:`_channel_envelopes`.
+
+        Parameters
+        ----------
+        signals : ndarray
+            Signals to process. The shape should be (..., N).
+
+        Returns
+        -------
+        channel_envs : ndarray
+            Low-pass filtered and downsampled subband envelopes. The shape is
+            (..., N_CHAN, N_DOWN).
+
+        """
+        if self._env_cache.maxsize < 1:
+            return self._channel_envelopes(signals)
+
+        rows = signals.reshape((-1, signals.shape[-1]))
+        keys = []
+        cached = {}
+        for i_row, row in enumerate(rows):
+            key = _scale_key(row)
+            keys.append(key)
+            entry = self._env_cache.get(key)
+            if entry is None:
+                continue
+            ref, ref_envs = entry
+            gain = _scaling_factor(row, ref)
+            if gain is not None:
+                cached[i_row] = np.abs(gain) * ref_envs
+
+        missing = [i_row for i_row in range(len(rows)) if i_row not in cached]
+        if missing:
+            missing_envs = self._channel_envelopes(rows[missing])
+            for i_row, envs in zip(missing, missing_envs):
+                cached[i_row] = envs
+                self._env_cache[keys[i_row]] = (rows[i_row].copy(), envs)
+
+        channel_envs = np.stack([cached[i_row] for i_row in range(len(rows))])
+        return channel_envs.reshape(signals.shape[:-1]
+                                    + channel_envs.shape[-2:])
 
     def _mod_filtering(self, channel_envs):
         """Filters the subband envelopes using a modulation filterbank.
 
+        All the signals and channels are filtered in a single call to the
+        modulation filterbank.
+
         Parameters
         ----------
         channels_envs : ndarray
-            Subband envelopes. The shape should be (N_SIG, N_CHAN, N).
+            Downsampled subband envelopes. The shape should be (N_SIG,
+            N_CHAN, N).
 
         Returns
         -------
-        envs : ndarray
-            Modulation subband signals. The shape is (N_SIG, N_CHAN, N_MODF, N).
+        envs : ndarray or None
+            Modulation subband signals. The shape is (N_SIG, N_CHAN, N_MODF, N),
+            where N is the odd length of the downsampled envelopes. It is
+            `None` if the modulation filterbank only outputs the powers,
+            which is the case for the sEPSM.
         powers : ndarray
             Modulation power at the output of the modulation filterbank. The
             shape is (N_SIG, N_CHAN, N_MODF).
 
         """
-        # Downsample the envelope for faster processing
-        channel_envs = channel_envs[..., ::self.downsamp_factor]
+        # Make the envelopes odd length, like the reference implementation
+        # of the model.
         if (channel_envs.shape[-1] % 2) == 0:
-            len_offset = 1
+            channel_envs = channel_envs[..., :-1]
+        if self.mod_fb.output_time:
+            powers, envs = self.mod_fb.filter(channel_envs)
         else:
-            len_offset = 0
-        envs = np.zeros((channel_envs.shape[0],
-                         len(self.cf),
-                         len(self.modf),
-                         channel_envs.shape[-1] - len_offset)
-        )
-        powers = np.zeros((channel_envs.shape[0],
-                         len(self.cf),
-                         len(self.modf))
-        )
-        for i_sig, s in enumerate(channel_envs):
-            for i_chan, chan in enumerate(s):
-                powers[i_sig, i_chan], envs[i_sig, i_chan] =  \
-                    self.mod_fb.filter(chan)
+            powers = self.mod_fb.filter(channel_envs)
+            envs = None
         return envs, powers
 
     def predict(self, clean=None, mix=None, noise=None):
@@ -341,13 +594,12 @@ class Sepsm(object):
             signals = np.vstack((mix, noise))
         else:
             signals = np.vstack((clean, mix, noise))
+        signals = signals.astype(self.dtype, copy=False)
 
         # find bands above threshold
-        bands_above_thres_idx = self._find_bands_above_thres(mix)
+        bands_above_thres_idx = self._find_bands_above_thres(mix, clean, noise)
 
-        channel_sigs = self._peripheral_filtering(signals)
-        channel_envs = self._extract_env(channel_sigs)
-        channel_envs = self._mod_sensitivity(channel_envs)
+        channel_envs = self._cached_channel_envelopes(signals)
         filtered_envs, exc_ptns = self._mod_filtering(channel_envs)
         snr_env_matrix, _ = self._snr_env(*exc_ptns[-2:])
         snr_env = self._optimal_combination(snr_env_matrix,
@@ -364,6 +616,98 @@ class Sepsm(object):
 
         return res
 
+    def predict_batch(self, clean=None, mix=None, noise=None, lengths=None,
+                      batch_size=8):
+        """Predicts intelligibility for many conditions at once.
+
+        The items of the batch with the same length are processed together,
+        `batch_size` at a time, through the whole model. The predictions are
+        the same as calling :py:func:`predict` on each item.
+
+        Parameters
+        ----------
+        clean : ndarray (optional)
+            Clean speech signals, of shape (N_ITEMS, N). Optional.
+        mix : ndarray
+            Mixtures of the processed speech and noise, of shape (N_ITEMS,
+            N).
+        noise : ndarray
+            Processed noise signals alone, of shape (N_ITEMS, N).
+        lengths : array_like, optional
+            Length of each item, if the items have different lengths. The
+            item `i` is made of the first ``lengths[i]`` samples of each
+            signal, and the rest is ignored. By default, all the items have
+            N samples.
+        batch_size : int, optional
+            Maximum number of items processed together. Larger values use
+            more memory. (Default value = 8)
+
+        Returns
+        -------
+        res : dict
+            Dictionary of the model predictions, with the same keys as the
+            output of :py:func:`predict`:
+            - 'p': is a dictionary with a 'snr_env' key, with the SNRenv of
+            each item as an array of shape (N_ITEMS,).
+            - 'snr_env_matrix': SNRenv as a function of audio frequency and
+            modulation frequency, of shape (N_ITEMS, N_CHAN, N_MODF).
+            - 'exc_ptns': Modulation powers at the output of the modulation
+            filterbank, of shape (N_ITEMS, N_SIG, N_CHAN, N_MODF).
+            - 'bands_above_thres_idx': List of the arrays of indexes of the
+            bands that were above hearing threshold for each item.
+
+        """
+        if clean is None:
+            signals = np.stack((mix, noise), axis=1)
+        else:
+            signals = np.stack((clean, mix, noise), axis=1)
+        signals = signals.astype(self.dtype, copy=False)
+        n_items = signals.shape[0]
+        if lengths is None:
+            lengths = np.full(n_items, signals.shape[-1], dtype='int')
+        else:
+            lengths = np.asarray(lengths, dtype='int')
+
+        n_chan = len(self.cf)
+        n_modf = len(self.modf)
+        exc_ptns = np.empty((n_items, signals.shape[1], n_chan, n_modf),
+                            dtype=self.dtype)
+        snr_env_matrix = np.empty((n_items, n_chan, n_modf), dtype=self.dtype)
+        for length in np.unique(lengths):
+            same_length = np.flatnonzero(lengths == length)
+            for start in range(0, len(same_length), batch_size):
+                items = same_length[start:start + batch_size]
+                channel_envs = self._cached_channel_envelopes(
+                    signals[items, :, :length])
+                _, batch_exc_ptns = self._mod_filtering(channel_envs)
+                exc_ptns[items] = batch_exc_ptns
+                snr_env_matrix[items], _ = self._snr_env(
+                    batch_exc_ptns[:, -2], batch_exc_ptns[:, -1])
+
+        mix = np.asarray(mix)
+        noise = np.asarray(noise)
+        if clean is not None:
+            clean = np.asarray(clean)
+        bands_above_thres_idx = []
+        snr_env = np.empty(n_items)
+        for i_item, length in enumerate(lengths):
+            item_clean = None if clean is None else clean[i_item, :length]
+            bands_above_thres_idx.append(self._find_bands_above_thres(
+                mix[i_item, :length], item_clean, noise[i_item, :length]))
+            snr_env[i_item] = self._optimal_combination(
+                snr_env_matrix[i_item], bands_above_thres_idx[i_item])
+
+        res = {
+            'p': {
+                'snr_env': snr_env
+            },
+            'snr_env_matrix': snr_env_matrix,
+            'exc_ptns': exc_ptns,
+            'bands_above_thres_idx': bands_above_thres_idx
+        }
+
+        return res
+
     def plot_bands_above_thres(self, res):
         """Plot bands that were above threshold as a bar chart.
         
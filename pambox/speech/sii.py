@@ -4,6 +4,8 @@ from __future__ import division, print_function
 import numpy as np
 from numpy import log10, sum, asarray, zeros, ones
 
+from pambox import inner
+
 
 class Sii(object):
     """Speech intelligibility index model.
@@ -14,6 +16,8 @@ class Sii(object):
         Hearing threshold. 18 values in dB HL.
     I : int, optional, (Default is 0, normal speech)
         Band importance function selector. See Notes section below.
+    fs : int, optional, (Default is 22050)
+        Sampling frequency of the signals passed to :py:func:`predict`.
 
     Notes
     -----
@@ -39,7 +43,7 @@ class Sii(object):
         Index (1997).
     """
 
-    def __init__(self, T=zeros(18), I=0):
+    def __init__(self, T=zeros(18), I=0, fs=22050):
         T = asarray(T)
 
         if len(T) != 18:
@@ -49,6 +53,7 @@ class Sii(object):
                              and 1.")
         self.T = asarray(T)
         self.I = int(I)
+        self.fs = fs
 
         # Band center frequencies for 1/3rd octave procedure (Table 3)
         self.f = asarray([160, 200, 250, 315, 400, 500, 630, 800, 1000, 1250,
@@ -102,6 +107,17 @@ class Sii(object):
                            2.59,   7.67,   13.87,  23.45,
                            1.13,   5.07,   11.39,  20.72]).reshape(-1, 4)
 
+        # Spread of masking from band j to band i (4.3.2.5 Eq. 9). Only the
+        # bands below band i contribute to its masking.
+        self._spread = log10(0.89 * self.f[:, np.newaxis]
+                             / self.f[np.newaxis, :])
+        self._spread_mask = np.tri(18, k=-1, dtype=bool)
+
+        # Third-octave analysis of the waveforms, at the band center
+        # frequencies of the SII.
+        self.noct_filterbank = inner.RectangularFilterbank(self.fs, self.f,
+                                                           width=3)
+
     def _band_importance(self, test):
         """Get values of the band importance function.
 
@@ -149,20 +165,23 @@ class Sii(object):
         Parameters
         ----------
         E: array_like
-            Speech level in dB SPL.
+            Speech level in dB SPL. It can also be an array of shape
+            (N_CONDITIONS, 18), in which case all the conditions are
+            predicted at once.
         N: array_like, optional, (Default is -50 dB SPL)
-            Noise level in dB SPL.
+            Noise level in dB SPL. It is broadcast against `E`.
 
         Returns
         -------
         ndarray
-            Predicted SII value.
+            Predicted SII value. For an array of conditions, the SII is an
+            array of shape (N_CONDITIONS,).
         """
-        if isinstance(N, int):
-            N = N * ones(18)
+        E = np.asarray(E, dtype='float')
+        N = np.broadcast_to(np.asarray(N, dtype='float'), E.shape)
 
-        E[np.isnan(E)] = 0
-        N[np.isnan(N)] = 0
+        E = np.where(np.isnan(E), 0, E)
+        N = np.where(np.isnan(N), 0, N)
 
         # Self-Speech Masking Spectrum (4.3.2.1 Eq. 5)
         V = E - 24.
@@ -173,16 +192,18 @@ class Sii(object):
         # Calculate slope parameter Ci (4.3.2.3 Eq. 7)
         C = 0.6 * (B + 10. * log10(self.f) - 6.353) - 80.
 
+        # Calculate Equivalent Masking Spectrum Level (4.3.2.5 Eq. 9), for
+        # all the bands at once. The spread of masking is an array of shape
+        # (..., 18, 18), where the second to last dimension is the band being
+        # masked.
+        spread = B[..., np.newaxis, :] \
+            + 3.32 * C[..., np.newaxis, :] * self._spread
+        spread = np.where(self._spread_mask, spread, -np.inf)
+        Z = 10. * log10(10 ** (0.1 * N)
+                        + sum(10. ** (0.1 * spread), axis=-1))
         # Initialize Equivalent Masking Spectrum Level (4.3.2.4)
-        Z = zeros(18)
-        Z[0] = B[0]
-
-        # Calculate Equivalent Masking Spectrum Level (4.3.2.5 Eq. 9)
-        for i in range(1, 18):
-            Z[i] = 10. * log10(10 ** (0.1 * N[i])
-                               + sum(10. ** (0.1 * (B[0:i] + 3.32 * C[0:i]
-                                                    * log10(0.89 * self.f[i]
-                                                            / self.f[0:i])))))
+        Z[..., 0] = B[..., 0]
+
         # Disturbance Spectrum Level (4.5)
         D = np.fmax(Z, self.X)
 
@@ -198,10 +219,62 @@ class Sii(object):
         A = L * K
 
         # Speech Intelligibility Index (4.8 Eq. 14)
-        out = sum(self._band_importance(self.I) * A)
+        out = sum(self._band_importance(self.I) * A, axis=-1)
         res = {
             'p': {
                 'sii': np.fmax(out, 0)
             }
         }
         return res
+
+    def _spectrum_levels(self, x):
+        """Calculates the spectrum levels in the third-octave bands.
+
+        Parameters
+        ----------
+        x : ndarray
+            Signals, of shape (..., N). An RMS value of 1 corresponds to 0 dB
+            SPL.
+
+        Returns
+        -------
+        ndarray
+            Spectrum levels, in dB SPL, of shape (..., 18).
+
+        """
+        band_levels = 20. * log10(self.noct_filterbank.filter(x))
+        # Convert the band levels to spectrum levels, with the bandwidth of
+        # the third-octave bands (Table 3).
+        return band_levels - 10. * log10(self.f) + 6.353
+
+    def predict(self, clean=None, mix=None, noise=None):
+        """Predicts intelligibility from the waveforms of the speech and noise.
+
+        The spectrum levels of the speech and of the noise are calculated in
+        the 18 third-octave bands of the SII, using a rectangular
+        filterbank, and are passed to :py:func:`predict_spec`.
+
+        Parameters
+        ----------
+        clean : ndarray
+            Clean speech signal. It can also be a stack of signals, of shape
+            (..., N).
+        mix : ndarray, optional
+            Mixture of the speech and noise. It is not used by the SII, but is
+            accepted to have the same signature as the other models.
+        noise : ndarray
+            Noise signal alone, with the same shape as `clean`.
+
+        Returns
+        -------
+        dict
+            Predicted SII value, in the same format as the output of
+            :py:func:`predict_spec`.
+
+        """
+        if clean is None or noise is None:
+            raise ValueError("The SII requires the clean speech and the "
+                             "noise alone.")
+        clean = np.asarray(clean)
+        levels = self._spectrum_levels(np.stack((clean, np.asarray(noise))))
+        return self.predict_spec(levels[0], levels[1])
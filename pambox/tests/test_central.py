@@ -81,3 +81,60 @@ def test_mod_filtering_for_simple_signal():
                          9.70302212e-05, 3.88249957e-04, 1.55506496e-03,
                          6.25329663e-03])
     assert_allclose(p, target, rtol=1e-2)
+
+
+def test_mod_filterbank_transfer_functions_are_cached_by_length():
+    modf = np.asarray([1., 2., 4., 8., 16., 32., 64.])
+    mfb = central.EPSMModulationFilterbank(2205, modf)
+    tfs = mfb._transfer_functions(101)
+    assert tfs is central.EPSMModulationFilterbank(2205, modf) \
+        ._transfer_functions(101)
+    assert tfs is not mfb._transfer_functions(103)
+
+    pos_freqs = np.linspace(0, 2205 / 2, 51)
+    for res, target in zip(tfs, mfb._calculate_coefficients(pos_freqs)):
+        assert_allclose(res, target)
+
+
+def test_mod_filtering_of_stack_of_envelopes():
+    x = np.abs(np.random.RandomState(0).randn(2, 3, 200)) + 1
+    mfb = central.EPSMModulationFilterbank(2205, [1., 2., 4., 8., 16.])
+    powers, envs = mfb.filter(x)
+    assert powers.shape == (2, 3, 5)
+    assert envs.shape == (2, 3, 5, 200)
+    for idx in np.ndindex(x.shape[:-1]):
+        p, e = mfb.filter(x[idx])
+        assert_allclose(powers[idx], p)
+        assert_allclose(envs[idx], e)
+
+
+def test_mod_filtering_with_real_fft_matches_full_fft():
+    x = np.abs(np.random.RandomState(0).randn(201)) + 1
+    mfb = central.EPSMModulationFilterbank(2205, [1., 2., 4., 8., 16.])
+    powers, envs = mfb.filter(x)
+
+    n = len(x)
+    pos_freqs = np.linspace(0, 2205 / 2, n // 2 + 1)
+    freqs = np.concatenate((pos_freqs, pos_freqs[-1:0:-1]))
+    TFs, Wcf = mfb._calculate_coefficients(freqs)
+    X = np.fft.fft(x)
+    X_power = np.abs(X[:n // 2 + 1]) ** 2 / n
+    X_power[1:] *= 2
+    dc_power = X_power[0] / n / 2
+    target_powers = np.sum(X_power[1:] * Wcf[:, 1:n // 2 + 1], axis=-1) \
+        / n / dc_power
+    target_envs = np.real(np.fft.ifft(X * TFs, axis=-1))
+    assert_allclose(powers, target_powers)
+    assert_allclose(envs, target_envs, atol=1e-12)
+
+    # Even-length envelopes are not truncated.
+    powers, envs = mfb.filter(x[:-1])
+    assert envs.shape == (5, n - 1)
+
+
+def test_mod_filtering_outputs_powers_only():
+    x = np.abs(np.random.RandomState(0).randn(2, 201)) + 1
+    modf = [1., 2., 4., 8., 16.]
+    target, _ = central.EPSMModulationFilterbank(2205, modf).filter(x)
+    mfb = central.EPSMModulationFilterbank(2205, modf, output_time=False)
+    assert_allclose(mfb.filter(x), target)
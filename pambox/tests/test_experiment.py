@@ -1,16 +1,78 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
 import os.path
+import time
 
 import numpy as np
 from numpy.testing import assert_allclose
+import pandas as pd
 import pytest
 
 from pambox.speech import Experiment
+from pambox.speech.experiment import srt_dict_to_dataframe
 
 
 __DATA_ROOT__ = os.path.join(os.path.dirname(__file__), 'data')
 
+
+class DummyMaterial(object):
+    """Material with synthetic sentences and noise, which can be pickled."""
+    name = 'Dummy'
+    files = ['a.wav', 'b.wav', 'c.wav']
+
+    def load_file(self, filename):
+        ii = self.files.index(filename)
+        return np.sin(np.arange(100) * (ii + 1) / 10.)
+
+    def load_files(self, n=None):
+        for filename in self.files[:n]:
+            yield self.load_file(filename)
+
+    def ssn(self, x):
+        return np.random.randn(len(x))
+
+
+class DummyModel(object):
+    """Model that predicts the level of the mixture."""
+    name = 'Dummy'
+
+    def predict(self, clean, mix, noise):
+        return {'p': {'rms': np.sqrt(np.mean(mix ** 2)),
+                      'first': mix[0]}}
+
+
+
+class FailingModel(DummyModel):
+    """Dummy model that fails after a number of predictions."""
+
+    def __init__(self, n_ok):
+        self.n_ok = n_ok
+
+    def predict(self, clean, mix, noise):
+        if self.n_ok == 0:
+            raise RuntimeError('Interrupted')
+        self.n_ok -= 1
+        return super(FailingModel, self).predict(clean, mix, noise)
+
+
+class SlowFirstSentenceModel(DummyModel):
+    """Dummy model that fails slowly on the first sentence of
+    `ShortFirstSentenceMaterial`."""
+
+    def predict(self, clean, mix, noise):
+        if len(mix) == 50:
+            time.sleep(1)
+            raise RuntimeError('Interrupted')
+        return super(SlowFirstSentenceModel, self).predict(clean, mix, noise)
+
+
+class ShortFirstSentenceMaterial(DummyMaterial):
+
+    def load_file(self, filename):
+        x = super(ShortFirstSentenceMaterial, self).load_file(filename)
+        return x[:50] if filename == self.files[0] else x
+
+
 class TestExperiment(object):
     @pytest.mark.parametrize("fixed_target, target, masker, snr, exp_target, "
                              "exp_masker", (
@@ -49,5 +111,138 @@ class TestExperiment(object):
         assert_allclose(mix, exp_mix)
         assert_allclose(masker, exp_masker)
 
+    def test_process_run_gives_same_results_as_single_run(self):
+        exp = Experiment([DummyModel()], DummyMaterial(), [-5, 0, 5],
+                         write=False)
+        df_single = exp.run(n=3, seed=2)
+        df_processes = exp.run(n=3, seed=2, parallel='processes',
+                               n_workers=2)
+        cols = ['SNR', 'Sentence number', 'Output', 'Value']
+        assert len(df_single) == 3 * 3 * 2
+        assert df_single[cols].equals(df_processes[cols])
+
+    @pytest.mark.parametrize('parallel', (False, 'processes'))
+    def test_resumed_run_gives_same_results_as_full_run(self, tmpdir,
+                                                        parallel):
+        kwargs = dict(material=DummyMaterial(), snrs=[-5, 0, 5],
+                      output_path=str(tmpdir))
+        full = Experiment([DummyModel()], **kwargs).run(
+            n=3, seed=2, output_filename='full.csv')
+
+        with pytest.raises(RuntimeError):
+            Experiment([FailingModel(4)], **kwargs).run(
+                n=3, seed=2, output_filename='resumed.csv')
+        # Rows written after the last condition of the manifest are dropped.
+        with open(str(tmpdir.join('resumed.csv')), 'a') as f:
+            f.write('0,partial')
+        df = Experiment([DummyModel()], **kwargs).run(
+            n=3, seed=2, output_filename='resumed.csv', resume=True,
+            parallel=parallel, n_workers=2)
+
+        cols = ['SNR', 'Sentence number', 'Output', 'Value']
+        assert len(df) == len(full)
+        assert_allclose(df['Value'], full['Value'])
+        # The parallel runs write the sentences as they are completed.
+        written = pd.read_csv(str(tmpdir.join('resumed.csv')))[cols]
+        target = pd.read_csv(str(tmpdir.join('full.csv')))[cols]
+        assert written.sort_values(cols).reset_index(drop=True).equals(
+            target.sort_values(cols).reset_index(drop=True))
+
+    def test_streamed_run_with_different_distortion_parameters(self,
+                                                               tmpdir):
+        exp = Experiment([DummyModel()], DummyMaterial(), [0],
+                         distortion=lambda t, m, **kwargs: (t, m),
+                         dist_params=({'a': 1}, {'a': 2, 'b': 3}),
+                         output_path=str(tmpdir))
+        exp.run(n=2, output_filename='params.csv')
+        written = pd.read_csv(str(tmpdir.join('params.csv')))
+        assert len(written) == 2 * 2 * 2
+        assert list(written['a']) == [1, 1, 2, 2] * 2
+        assert written['b'].isnull().sum() == 4
+
+    def test_resume_after_manifest_line_cut_off(self, tmpdir):
+        kwargs = dict(material=DummyMaterial(), snrs=[-5, 0, 5],
+                      output_path=str(tmpdir))
+        full = Experiment([DummyModel()], **kwargs).run(
+            n=3, seed=2, output_filename='full.csv')
+        for resume in (False, True):
+            with pytest.raises(RuntimeError):
+                Experiment([FailingModel(4)], **kwargs).run(
+                    n=3, seed=2, output_filename='resumed.csv',
+                    resume=resume)
+            # Cut the last line of the manifest.
+            with open(str(tmpdir.join('resumed.csv.done')), 'r+') as f:
+                f.truncate(len(f.read()) - 5)
+        df = Experiment([DummyModel()], **kwargs).run(
+            n=3, seed=2, output_filename='resumed.csv', resume=True)
+        assert_allclose(df['Value'], full['Value'])
+        with open(str(tmpdir.join('resumed.csv.done'))) as f:
+            offsets = [int(line.split('\t')[0]) for line in f]
+        assert offsets == sorted(offsets)
+        assert offsets[-1] == tmpdir.join('resumed.csv').size()
+
+    def test_resume_with_empty_file_runs_everything(self, tmpdir):
+        exp = Experiment([DummyModel()], DummyMaterial(), [0],
+                         output_path=str(tmpdir))
+        exp.run(n=2, output_filename='empty.csv')
+        open(str(tmpdir.join('empty.csv')), 'w').close()
+        df = exp.run(n=2, output_filename='empty.csv', resume=True)
+        assert len(df) == 2 * 2
+        assert len(pd.read_csv(str(tmpdir.join('empty.csv')))) == 2 * 2
+
+    def test_process_run_writes_sentences_as_they_are_done(self, tmpdir):
+        exp = Experiment([SlowFirstSentenceModel()],
+                         ShortFirstSentenceMaterial(), [0],
+                         output_path=str(tmpdir))
+        with pytest.raises(RuntimeError):
+            exp.run(n=3, output_filename='slow.csv', parallel='processes',
+                    n_workers=2)
+        written = pd.read_csv(str(tmpdir.join('slow.csv')))
+        assert sorted(set(written['Sentence number'])) == [1, 2]
+
+    def test_resume_requires_output_filename(self, tmpdir):
+        exp = Experiment([DummyModel()], DummyMaterial(), [0],
+                         output_path=str(tmpdir))
+        with pytest.raises(ValueError):
+            exp.run(n=1, resume=True)
+
+    def test_process_run_raises_errors_of_workers(self):
+        exp = Experiment([FailingModel(0)], DummyMaterial(), [0],
+                         write=False)
+        with pytest.raises(RuntimeError):
+            exp.run(n=3, parallel='processes', n_workers=2)
+
+    def test_append_results_adds_one_row_per_output(self):
+        exp = Experiment([DummyModel()], DummyMaterial(), [0], write=False)
+        res = {'p': {'rms': 1., 'first': 0.5}}
+        df = exp.append_results(pd.DataFrame(), res, DummyModel(), 0, 1,
+                                None, SRT=-3.)
+        df = exp.append_results(df, res, DummyModel(), 5, 2, None)
+        assert len(df) == 4
+        assert list(df['SNR']) == [0, 0, 5, 5]
+        assert df['Value'].dtype == np.float64
+        assert df['SRT'].iloc[0] == -3.
+
+    def test_srts_from_df_for_each_distortion_and_output(self):
+        exp = Experiment([DummyModel()], DummyMaterial(), [-5, 0, 5],
+                         write=False)
+        df = exp.run(n=2)
+        df = pd.concat([df.assign(**{'Distortion params': 'a'}),
+                        df.assign(**{'Distortion params': 'b'})],
+                       ignore_index=True)
+        df['Intelligibility'] = 50. + 4 * df['SNR'] \
+            + 8 * (df['Distortion params'] == 'b')
+        srts = exp.srts_from_df(df, model_srts={('Dummy', 'rms'): 40})
+        srts = srts.set_index(['Distortion params', 'Output'])['SRT']
+        assert_allclose(srts[('a', 'first')], 0.)
+        assert_allclose(srts[('b', 'first')], -2.)
+        assert_allclose(srts[('a', 'rms')], -2.5)
+        assert_allclose(srts[('b', 'rms')], -4.5)
 
 
+def test_srt_dict_to_dataframe():
+    df = srt_dict_to_dataframe({'sepsm_clue_0_10': [-2.],
+                                'sepsm_clue_0_5': [-4.],
+                                'sii_clue_0_5': None})
+    assert list(df['mdist']) == [5, 10, 5]
+    assert_allclose(df['srt'], [-4., -2., np.nan])
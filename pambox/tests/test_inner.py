@@ -4,10 +4,12 @@ import csv
 import os.path
 
 import numpy as np
+import pytest
 import scipy.io as sio
+import scipy.signal as ss
 from numpy.testing import assert_allclose
 
-from pambox import inner
+from pambox import inner, utils
 
 
 __DATA_ROOT__ = os.path.join(os.path.dirname(__file__), 'data')
@@ -62,23 +64,30 @@ def test_third_octave_filtering_of_noise_():
 
 
 def test_hilbert_env_on_2d_array_with_last_dimension():
+    # The reference envelopes were calculated with the signals zero-padded
+    # to a power of 2.
     tests = (
         ([0.70710678, 1.56751612, 2., 1.56751612, 0.70710678],
-         [0, 1, 2, 1, 0]),
-        ([0.70710678, 1.56751612, 2., 1.56751612, 0.70710678],
-         [0, 1, 2, 1, 0]),
+         [0, 1, 2, 1, 0, 0, 0, 0]),
         ([[0., 1.], [0., 1.]],
          [[0, 1], [0, 1]]),
         ([[0.5, 1., 0.5], [2.5, 3.16227766, 1.5]],
-         [[0, 1, 0], [2, 3, 0]]),
+         [[0, 1, 0, 0], [2, 3, 0, 0]]),
     )
 
     for target, x in tests:
         env = inner.hilbert_envelope(x)
-        np.testing.assert_allclose(env, target,
+        np.testing.assert_allclose(env[..., :np.shape(target)[-1]], target,
                                    err_msg="Input was {}".format(x))
 
 
+def test_hilbert_envelope_matches_analytic_signal():
+    x = np.random.RandomState(0).randn(3, 1001)
+    n_fft = utils.next_fast_len(1001)
+    target = np.abs(ss.hilbert(x, n_fft)[..., :1001])
+    assert_allclose(inner.hilbert_envelope(x), target, atol=1e-12)
+
+
 def test_envelope_extraction():
     x = np.array(
         [-0.00032745, -0.00031198, -0.00029605, -0.00027965, -0.00026281,
@@ -88,3 +97,126 @@ def test_envelope_extraction():
          0.00070113, 0.00070502, 0.0007089])
     envelope = inner.hilbert_envelope(x)
     np.testing.assert_allclose(envelope, target, atol=1e-3)
+
+
+def test_GammatoneFilterbank_sos_matches_cascaded_lfilter():
+    fs = 22050
+    cf = [63, 250, 1000, 4000, 8000]
+    x = np.random.RandomState(0).randn(2048)
+    g = inner.GammatoneFilterbank(fs, cf)
+    a0, a11, a12, a13, a14, a2, b0, b1, b2, gain = \
+        g._calculate_coefficients()
+    for chan, y in enumerate(g.filter(x)):
+        a = [b0[chan], b1[chan], b2[chan]]
+        target = ss.lfilter([a0[chan] / gain[chan], a11[chan] / gain[chan],
+                             a2[chan] / gain[chan]], a, x)
+        for a1 in (a12, a13, a14):
+            target = ss.lfilter([a0[chan], a1[chan], a2[chan]], a, target)
+        assert_allclose(y, target, rtol=1e-9, atol=1e-12)
+
+
+def test_GammatoneFilterbank_coefficients_are_shared_and_follow_attributes():
+    g1 = inner.GammatoneFilterbank(22050, [100, 1000])
+    g2 = inner.GammatoneFilterbank(22050, [100, 1000])
+    assert g1._calculate_sos() is g2._calculate_sos()
+
+    g2.cf = np.asarray([100, 2000])
+    target = inner.GammatoneFilterbank(22050, [100, 2000])._calculate_sos()
+    assert g1._calculate_sos() is not g2._calculate_sos()
+    assert_allclose(g2._calculate_sos(), target)
+
+
+def test_GammatoneFilterbank_filters_stack_of_signals():
+    x = np.random.RandomState(0).randn(2, 3, 512)
+    g = inner.GammatoneFilterbank(22050, [100, 1000, 4000])
+    y = g.filter(x)
+    assert y.shape == (2, 3, 3, 512)
+    for idx in np.ndindex(x.shape[:-1]):
+        assert_allclose(y[idx], g.filter(x[idx]))
+
+
+def test_stateful_GammatoneFilterbank_chunks_match_full_signal():
+    x = np.random.RandomState(0).randn(2, 1000)
+    g = inner.GammatoneFilterbank(22050, [100, 1000, 4000], stateful=True)
+    target = inner.GammatoneFilterbank(22050, [100, 1000, 4000]).filter(x)
+    chunks = [g.filter(chunk) for chunk in np.split(x, [300, 600], axis=-1)]
+    assert_allclose(np.concatenate(chunks, axis=-1), target)
+
+    g.reset()
+    assert_allclose(g.filter(x), target)
+
+
+def test_hilbert_envelope_in_single_precision():
+    x = np.random.RandomState(0).randn(3, 1000)
+    env = inner.hilbert_envelope(x.astype('float32'), dtype='float32')
+    assert env.dtype == np.float32
+    assert_allclose(env, inner.hilbert_envelope(x), rtol=1e-3, atol=1e-5)
+
+
+def test_lowpass_env_decimation_matches_filtering_and_slicing():
+    rng = np.random.RandomState(0)
+    x = np.abs(rng.randn(2, 3, 1003))
+    for n, factor in ((1, 10), (3, 7)):
+        target = inner.lowpass_env_filtering(x, 150., n, 22050.)[..., ::factor]
+        y = inner.lowpass_env_decimation(x, factor, 150., n, 22050.)
+        assert y.shape == target.shape
+        assert_allclose(y, target, rtol=1e-7, atol=1e-10)
+
+
+def test_lowpass_env_decimation_stays_in_single_precision():
+    tracemalloc = pytest.importorskip('tracemalloc')
+    x = np.abs(np.random.RandomState(0).randn(3, 4, 20000))
+    target = inner.lowpass_env_filtering(x, 150., 1, 22050.)[..., ::10]
+    x = x.astype(np.float32)
+    inner.lowpass_env_decimation(x[..., :100], 10)
+    tracemalloc.start()
+    y = inner.lowpass_env_decimation(x, 10)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert y.dtype == np.float32
+    assert_allclose(y, target, rtol=1e-5, atol=1e-6)
+    # The full-rate input is not copied to double precision.
+    assert peak < x.nbytes
+
+
+def test_GammatoneFilterbank_filters_subset_of_channels():
+    x = np.random.RandomState(0).randn(2, 500)
+    g = inner.GammatoneFilterbank(22050, [250, 500, 1000, 2000, 4000])
+    target = g.filter(x)
+    assert_allclose(g.filter(x, channels=slice(1, 3)), target[:, 1:3])
+    assert_allclose(g.filter(x, channels=[4, 0]), target[:, [4, 0]])
+
+
+def test_RectangularFilterbank_filters_stack_of_signals():
+    x = np.random.RandomState(0).randn(2, 3, 2000)
+    center_f = [63, 250, 1000, 4000, 16000]
+    filterbank = inner.RectangularFilterbank(22050, center_f,
+                                             output_time=True)
+    rms_out, time_out = filterbank.filter(x)
+    assert rms_out.shape == (2, 3, 5)
+    assert time_out.shape == (2, 3, 5, 2000)
+    single_rms, single_time = filterbank.filter(x[1, 2])
+    assert_allclose(rms_out[1, 2], single_rms)
+    assert_allclose(time_out[1, 2], single_time)
+    # The band above the Nyquist frequency is empty.
+    assert_allclose(rms_out[..., -1], 0)
+    # The bands add up to the band-limited signal.
+    assert_allclose(np.sqrt(np.mean(time_out[1, 2, 2] ** 2)), single_rms[2])
+
+    filterbank.time_bands = [2]
+    _, band_out = filterbank.filter(x)
+    assert_allclose(band_out[:, :, 0], time_out[:, :, 2])
+
+
+def test_RectangularFilterbank_with_empty_last_band():
+    # With 8 samples, the band at 4010 Hz has no frequency bin.
+    x = np.random.RandomState(0).randn(8)
+    rms_out = inner.RectangularFilterbank(22050, [4000, 4010]).filter(x)
+    spec = np.abs(np.fft.rfft(x)) ** 2 / 8
+    spec[1:] *= 2
+    assert_allclose(rms_out, [np.sqrt(spec[1] / 8), 0])
+    # All the bands are above the Nyquist frequency.
+    filterbank = inner.RectangularFilterbank(8000, [5000], output_time=True)
+    rms_out, time_out = filterbank.filter(np.random.RandomState(0).randn(100))
+    assert_allclose(rms_out, [0])
+    assert_allclose(time_out, np.zeros((1, 100)))
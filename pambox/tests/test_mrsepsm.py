@@ -3,6 +3,7 @@ from __future__ import division, print_function, absolute_import
 import os.path
 import pytest
 from pambox.speech import MrSepsm
+from pambox.speech.mrsepsm import MrPowers
 import scipy.io as sio
 import numpy as np
 from numpy.testing import assert_allclose
@@ -32,9 +33,9 @@ def test_mr_sepsm_mr_env_powers(mr):
     mod_channel_envs = mod_channel_envs[np.newaxis, np.newaxis, :, :]
 
     mr_env_powers = mr._mr_env_powers(channel_env, mod_channel_envs)
-    for d, target in zip(mr_env_powers[0, 0],
+    for d, target in zip(mr_env_powers[0, 0].bands(),
                          mat['mr_env_powers']):
-        assert_allclose(d.compressed(), target[0])
+        assert_allclose(d, target[0])
 
 
 def test_mr_snr_env(mr, mat):
@@ -44,8 +45,10 @@ def test_mr_snr_env(mr, mat):
     mat_mix = sio.loadmat(__DATA_ROOT__ + '/test_mr_sepsm_mr_snr_env_mix.mat')
     mat_noise = sio.loadmat(__DATA_ROOT__ +
                             '/test_mr_sepsm_mr_snr_env_noise.mat')
-    od_mix = np.ma.MaskedArray(mat_mix['data'], mat_mix['mask'])
-    od_noise = np.ma.MaskedArray(mat_noise['data'], mat_noise['mask'])
+    od_mix = MrPowers.from_masked(
+        np.ma.MaskedArray(mat_mix['data'], mat_mix['mask']))
+    od_noise = MrPowers.from_masked(
+        np.ma.MaskedArray(mat_noise['data'], mat_noise['mask']))
     mr_snr_env, exc_ptns = mr._mr_snr_env(od_mix, od_noise)
     time_av_snr_env = mr._time_average(mr_snr_env)
     assert_allclose(time_av_snr_env, mat['timeAvg_SNRenvs'])
@@ -60,7 +63,8 @@ def test_mr_sepsm_time_averaging_of_short_term_snr_env(mat):
     in_mat = sio.loadmat(__DATA_ROOT__ +
                             '/test_mr_sepsm_time_average_snr.mat',
                       squeeze_me=True)
-    mr_snr_env = np.ma.MaskedArray(in_mat['data'], in_mat['mask'])
+    mr_snr_env = MrPowers.from_masked(
+        np.ma.MaskedArray(in_mat['data'], in_mat['mask']))
 
     mr = MrSepsm()
     t_av = mr._time_average(mr_snr_env)
@@ -88,3 +92,58 @@ def test_complete_mr_sepsm(mr):
             , target
             , rtol=0.01
         )
+
+
+def test_mr_env_powers_of_stacked_signals_match_single_signals(mr):
+    rng = np.random.RandomState(0)
+    channel_envs = np.abs(rng.randn(2, 3, 1000)) + 1
+    filtered_envs = rng.randn(2, 3, len(mr.modf), 999)
+    mr_env_powers = mr._mr_env_powers(channel_envs, filtered_envs)
+    for i_sig in range(2):
+        for i_chan in range(3):
+            target = mr._mr_env_powers(
+                channel_envs[i_sig, i_chan][np.newaxis, np.newaxis],
+                filtered_envs[i_sig, i_chan][np.newaxis, np.newaxis])
+            assert_allclose(mr_env_powers[i_sig, i_chan].data,
+                            target[0, 0].data)
+
+
+def test_mr_powers_round_trip_through_masked_array():
+    data = np.arange(2 * 3 * 7, dtype='float').reshape(2, 3, 7)
+    p = MrPowers(data, [1, 2, 4])
+    masked = p.to_masked()
+    assert masked.shape == (2, 3, 3, 4)
+    assert_allclose(masked[1, 2, 1].compressed(), data[1, 2, 1:3])
+    assert_allclose(MrPowers.from_masked(masked).data, data)
+    assert_allclose(p.mean(), masked.mean(axis=-1))
+
+
+def test_mr_sepsm_predict_batch_matches_single_predictions(mr):
+    rng = np.random.RandomState(0)
+    lengths = [6000, 5000]
+    mixes = np.zeros((2, 6000))
+    noises = np.zeros((2, 6000))
+    for ii, length in enumerate(lengths):
+        noises[ii, :length] = rng.randn(length)
+        mixes[ii, :length] = noises[ii, :length] + rng.randn(length) * \
+            np.abs(np.sin(np.arange(length) / 500.))
+    res = mr.predict_batch(mix=mixes, noise=noises, lengths=lengths,
+                           batch_size=2)
+    assert res['snr_env_matrix'].shape == (2, len(mr.cf), len(mr.modf))
+    for ii, length in enumerate(lengths):
+        target = mr.predict(mix=mixes[ii, :length], noise=noises[ii, :length])
+        assert_allclose(res['p']['snr_env'][ii], target['p']['snr_env'])
+        assert_allclose(res['p']['lt_snr_env'][ii], target['p']['lt_snr_env'])
+        assert_allclose(res['mr_snr_env_matrix'][ii].data,
+                        target['mr_snr_env_matrix'].data)
+
+
+def test_mr_sepsm_time_signals_have_full_rate_envelopes():
+    rng = np.random.RandomState(0)
+    noise = rng.randn(5000)
+    mix = noise + rng.randn(5000) * np.abs(np.sin(np.arange(5000) / 500.))
+    mr_time = MrSepsm(output_time_signals=True)
+    res = mr_time.predict(mix, mix, noise)
+    assert res['chan_envs'].shape == (3, len(mr_time.cf), 5000)
+    assert_allclose(res['p']['snr_env'],
+                    MrSepsm().predict(mix, mix, noise)['p']['snr_env'])
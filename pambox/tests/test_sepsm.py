@@ -6,6 +6,7 @@ import pytest
 from scipy.io import wavfile
 import numpy as np
 import scipy.io as sio
+from pambox import utils
 from pambox.speech import sepsm
 from numpy.testing import assert_allclose, assert_array_equal
 
@@ -56,17 +57,21 @@ def test_snr_env():
         assert_allclose(snrenv, target)
 
 
-def test_sepsm_prediction_snr_min9_db():
+def _load_full_sepsm_signals():
+    """Load the mixture and noise of the full sEPSM test case."""
     with open(os.path.join(__DATA_ROOT__, 'test_full_sepsm.csv')) as csv_file:
         data_file = csv.reader(csv_file)
-        temp = next(data_file)
-        n_samples = int(temp[0])
+        n_samples = int(next(data_file)[0])
         mix = np.empty(n_samples)
         noise = np.empty(n_samples)
-
         for i, (m, n) in enumerate(data_file):
-            mix[i] = np.asarray(m, dtype=np.float)
-            noise[i] = np.asarray(n, dtype=np.float)
+            mix[i] = float(m)
+            noise[i] = float(n)
+    return mix, noise
+
+
+def test_sepsm_prediction_snr_min9_db():
+    mix, noise = _load_full_sepsm_signals()
 
     target_snr_env = 9.57297
 
@@ -86,3 +91,85 @@ def test_sepsm_predictions_snr_0_kappa_0_8():
         target = mat['results'][ii].SNRenv
         res = c.predict(mix, mix, noise)
         assert_allclose(target, res['p']['snr_env'], rtol=8e-2)
+
+
+def test_sepsm_single_precision_matches_double_precision():
+    mix, noise = _load_full_sepsm_signals()
+
+    target = sepsm.Sepsm().predict(mix, mix, noise)
+    res = sepsm.Sepsm(dtype='float32').predict(mix, mix, noise)
+    assert res['exc_ptns'].dtype == np.float32
+    assert_allclose(res['p']['snr_env'], target['p']['snr_env'], rtol=1e-3)
+
+
+@pytest.mark.parametrize("chan_block_size", [1, 5, None])
+def test_sepsm_channel_blocks_match_all_channels(chan_block_size):
+    rng = np.random.RandomState(0)
+    mix = rng.randn(4000)
+    noise = rng.randn(4000)
+    c = sepsm.Sepsm(chan_block_size=chan_block_size)
+    signals = np.vstack((mix, noise))
+    target = c._mod_sensitivity(
+        c._extract_env(c._peripheral_filtering(signals)))
+    assert_allclose(c._channel_envelopes(signals), target, rtol=1e-12)
+
+
+def test_sepsm_predict_batch_matches_single_predictions():
+    rng = np.random.RandomState(0)
+    lengths = [6000, 5000, 6000]
+    mixes = np.zeros((3, 6000))
+    noises = np.zeros((3, 6000))
+    for ii, length in enumerate(lengths):
+        noises[ii, :length] = utils.setdbspl(rng.randn(length), 65)
+        mixes[ii, :length] = noises[ii, :length] + utils.setdbspl(
+            rng.randn(length) * np.abs(np.sin(np.arange(length) / 500.)), 65)
+
+    c = sepsm.Sepsm()
+    res = c.predict_batch(mix=mixes, noise=noises, lengths=lengths)
+    assert res['exc_ptns'].shape == (3, 2, len(c.cf), len(c.modf))
+    for ii, length in enumerate(lengths):
+        target = c.predict(mixes[ii, :length], mixes[ii, :length],
+                           noises[ii, :length])
+        assert_allclose(res['p']['snr_env'][ii], target['p']['snr_env'])
+        assert_allclose(res['exc_ptns'][ii], target['exc_ptns'][1:])
+        assert_array_equal(res['bands_above_thres_idx'][ii],
+                           target['bands_above_thres_idx'])
+
+
+def test_sepsm_reuses_envelopes_of_scaled_signals():
+    rng = np.random.RandomState(0)
+    target = utils.setdbspl(rng.randn(4000), 65)
+    noise = rng.randn(4000)
+    c = sepsm.Sepsm()
+    c_no_cache = sepsm.Sepsm(env_cache_size=0)
+    for snr in (0, 6):
+        masker = utils.setdbspl(noise, 65 - snr)
+        res = c.predict(target, target + masker, masker)
+        ref = c_no_cache.predict(target, target + masker, masker)
+        assert_allclose(res['exc_ptns'], ref['exc_ptns'], rtol=1e-10)
+    # The target and the masker are only cached once, the mixtures twice.
+    assert len(c._env_cache) == 4
+
+
+def test_sepsm_mixture_band_rms_from_cached_band_powers():
+    rng = np.random.RandomState(0)
+    target = utils.setdbspl(rng.randn(4000), 65)
+    noise = rng.randn(4000)
+    c = sepsm.Sepsm()
+    for snr in (-10, 0, 10):
+        masker = utils.setdbspl(noise, 65 - snr)
+        mix = target + masker
+        assert_allclose(c._mixture_band_rms(target, mix, masker),
+                        c.noct_filterbank.filter(mix), rtol=1e-10)
+    assert len(c._band_cache) == 2
+    # With a new noise, the band powers of the clean speech are reused.
+    masker = rng.randn(4000)
+    mix = target + masker
+    assert_allclose(c._mixture_band_rms(target, mix, masker),
+                    c.noct_filterbank.filter(mix), rtol=1e-10)
+    assert len(c._band_cache) == 3
+    assert len(c._cross_cache) == 2
+    # A mixture that is not the sum of the clean speech and noise is
+    # filtered directly.
+    assert_allclose(c._mixture_band_rms(target, 2 * mix, masker),
+                    c.noct_filterbank.filter(2 * mix))
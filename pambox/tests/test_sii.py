@@ -21,3 +21,39 @@ def test_sii():
         ss = s.predict_spec(E*np.ones(18), N*np.ones(18))
         assert_allclose(ss['p']['sii'], SII, rtol=1e-4)
 
+
+
+def test_sii_predicts_array_of_conditions():
+    rng = np.random.RandomState(0)
+    E = rng.uniform(0, 80, (20, 18))
+    N = rng.uniform(0, 80, (20, 18))
+    s = Sii(T=rng.uniform(0, 20, 18), I=2)
+    sii = s.predict_spec(E, N)['p']['sii']
+    assert sii.shape == (20,)
+    for i_cond, (e, n) in enumerate(zip(E, N)):
+        assert_allclose(sii[i_cond], s.predict_spec(e, n)['p']['sii'])
+
+
+def test_sii_spectrum_levels_of_white_noise():
+    fs = 22050
+    x = np.random.RandomState(0).randn(4, fs)
+    x /= np.sqrt(np.mean(x ** 2, axis=-1, keepdims=True))
+    s = Sii(fs=fs)
+    # A white noise with an RMS of 1 (0 dB SPL) spreads its power uniformly
+    # up to the Nyquist frequency. The band powers are averaged across
+    # signals because the low bands only have a few frequency bins.
+    levels = 10 * np.log10(np.mean(10 ** (s._spectrum_levels(x) / 10), axis=0))
+    assert_allclose(levels, -10 * np.log10(fs / 2), atol=1)
+
+
+def test_sii_predict_from_waveforms_increases_with_snr():
+    rng = np.random.RandomState(0)
+    clean = rng.randn(22050)
+    clean *= 10 ** (65 / 20) / np.sqrt(np.mean(clean ** 2))
+    noise = rng.randn(22050)
+    noise /= np.sqrt(np.mean(noise ** 2))
+    s = Sii()
+    sii = [s.predict(clean, clean + g * noise, g * noise)['p']['sii']
+           for g in 10 ** (np.array([85, 65, 45]) / 20)]
+    assert_allclose(sii[0], 0)
+    assert sii[0] < sii[1] < sii[2] <= 1
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
 import os.path
+import pickle
 
 import pytest
 import numpy as np
+import scipy.io.wavfile
 from numpy.testing import assert_allclose, dec, TestCase
 
 from pambox.speech import material
@@ -33,3 +35,38 @@ def test_set_level():
     x = utils.setdbspl(x, sentence_level)
     level = utils.dbspl(c.set_level(x, ref_level + 3))
     assert_allclose(level, sentence_level + 3)
+
+
+def test_pickled_material_reloads_ssn():
+    c = material.Material(path_to_ssn=os.path.join(__DATA_ROOT__,
+                                                   'dummy_ssn.wav'))
+    state = c.__getstate__()
+    assert state['_ssn'] is None
+    c2 = pickle.loads(pickle.dumps(c))
+    assert_allclose(c2.ssn(), c.ssn())
+
+
+def test_mapped_material_matches_material(tmpdir):
+    sentences_dir = tmpdir.mkdir('sentences')
+    for ii, n in enumerate([100, 150, 80]):
+        x = (np.random.randn(n) * 1000).astype(np.int16)
+        scipy.io.wavfile.write(str(sentences_dir.join('s%d.wav' % ii)),
+                               22050, x)
+    ssn_path = str(tmpdir.join('ssn.wav'))
+    scipy.io.wavfile.write(ssn_path, 22050,
+                           (np.random.randn(500) * 1000).astype(np.int16))
+    c = material.Material(path_to_sentences=str(sentences_dir),
+                          path_to_ssn=ssn_path)
+    m = material.MappedMaterial.create(c, str(tmpdir.join('corpus')))
+    assert m.files == c.files
+    for name in c.files:
+        assert_allclose(m.load_file(name), c.load_file(name))
+    assert_allclose(m.ssn(), c.ssn())
+    assert m.ssn(50).flags.writeable
+
+    state = m.__getstate__()
+    assert state['_sentences'] is None and state['_ssn'] is None
+    m2 = pickle.loads(pickle.dumps(m))
+    assert isinstance(m2._sentences, np.memmap)
+    for name in c.files:
+        assert_allclose(m2.load_file(name), c.load_file(name))
@@ -274,3 +274,22 @@ def test_hilbert():
     x = np.random.randn(100)
     assert_allclose(utils.hilbert(x),
                     signal.hilbert(x))
+
+
+def test_lru_cache_discards_least_recently_used_item():
+    cache = utils.LRUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+    cache['c'] = 3
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get('b', 'missing') == 'missing'
+    assert len(cache) == 2
+
+
+@pytest.mark.parametrize("n, target", [
+    (1, 1), (7, 8), (11, 12), (97, 100), (1001, 1024), (68000, 69120),
+])
+def test_next_fast_len_is_5_smooth(n, target):
+    assert utils.next_fast_len(n) == target
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import division
+from collections import OrderedDict
 
 from matplotlib import pyplot as plt
 import numpy as np
@@ -12,8 +13,12 @@ except AttributeError:
         import mklfft  # MKL FFT optimizations from Continuum Analytics
         from numpy.fft import fft, ifft
     except ImportError:
-        # Finally, just use Scipy's
-        from scipy.fftpack import fft, ifft
+        try:
+            # SciPy >= 1.4 keeps single-precision inputs in single precision
+            from scipy.fft import fft, ifft
+        except ImportError:
+            # Finally, just use Scipy's
+            from scipy.fftpack import fft, ifft
 
 import scipy as sp
 from scipy import signal as ss
@@ -211,7 +216,8 @@ def hilbert(x, N=None, axis=-1):
         raise ValueError("N must be positive.")
 
     Xf = fft(x, N, axis=axis)
-    h = np.zeros(N)
+    # Keep the precision of the transform, e.g. complex64 for float32 inputs.
+    h = np.zeros(N, dtype=Xf.real.dtype)
     if N % 2 == 0:
         h[0] = h[N // 2] = 1
         h[1:N // 2] = 2
@@ -222,11 +228,46 @@ def hilbert(x, N=None, axis=-1):
     if len(x.shape) > 1:
         ind = [np.newaxis] * x.ndim
         ind[axis] = slice(None)
-        h = h[ind]
+        h = h[tuple(ind)]
     x = ifft(Xf * h, axis=axis)
     return x
 
 
+def next_fast_len(n):
+    """Calculates the next length that is efficient for FFTs.
+
+    The efficient lengths are the 5-smooth numbers, i.e. numbers whose only
+    prime factors are 2, 3, and 5. They are much closer to `n` than the next
+    power of 2.
+
+    Parameters
+    ----------
+    n : int
+        Minimum length.
+
+    Returns
+    -------
+    int
+        Smallest 5-smooth number greater than or equal to `n`.
+
+    """
+    n = int(n)
+    if n <= 6:
+        return n if n > 0 else 1
+    best = next_pow_2(n)
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            # Smallest power of 2 such that p2 * p35 >= n.
+            p2 = next_pow_2(-(-n // p35))
+            if p2 * p35 < best:
+                best = p2 * p35
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
 def next_pow_2(x):
     """Calculates the next power of 2 of a number.
 
@@ -632,3 +673,71 @@ def read_wav_as_float(path):
     if np.issubdtype(signal.dtype, np.integer):
         return signal.T / np.abs(np.iinfo(signal.dtype).min)
     return signal.T
+
+
+class LRUCache(object):
+    """Mapping of limited size that discards the least recently used items.
+
+    It is used to share expensive-to-compute values, such as filter
+    coefficients, between calls and between instances. The cached values
+    should be treated as read-only.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of items kept in the cache. (Default value = 32)
+
+    Examples
+    --------
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3  # 'b' is the least recently used item.
+    >>> 'b' in cache
+    False
+
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def get(self, key, default=None):
+        """Returns the value for `key`, and marks it as recently used.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the item.
+        default : object, optional
+            Value returned if `key` is not in the cache. (Default value =
+            None)
+
+        Returns
+        -------
+        object
+        """
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value
+        return value
+
+    def clear(self):
+        """Removes all the items from the cache."""
+        self._items.clear()